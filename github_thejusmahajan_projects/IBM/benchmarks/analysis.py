@@ -0,0 +1,406 @@
+"""
+Benchmarks of the Python analysis on synthetic wcm.x output.
+
+Each benchmark is a function registered with @benchmark that receives a
+SyntheticRun (the output directory of synthetic.py plus the arrays read
+from it) and returns the callable to time, in the spirit of asv's
+time_* methods: setup happens outside the timed call. Every benchmark runs
+on synthetic runs of 1, 10 and 100 simulated years (generated once under
+benchmarks/data/). Timing follows pytest-benchmark: one warm-up call, then
+--repeat rounds summarised by min / median / mean / stddev; a call slower
+than --max-seconds is measured once. As in asv, each case runs in a forked
+child process, so a case that exhausts the memory (the gouraud pcolormesh
+of a 100-year run does) is reported as failed instead of ending the suite;
+the peak RSS of the child is recorded with the timings.
+
+The cases mirror what the study scripts do: reading fort.10/11/12 directly
+and through the run cache, trait moments, the seasonal lag (whole run and
+year by year), the Gaussian smoothing (whole matrix and tiled) and the
+rendering of the Hovmoller diagram (gouraud pcolormesh and pixel-column
+raster), the trait animation of plot_results.py and its adaptive frame
+selection, Gaussian fits of monthly trait snapshots, a warm derived cache
+and the statistics of plot_hindcast.py. Results are compared with the
+committed baseline benchmarks/baselines/analysis.json on the fastest
+round, the least noisy statistic; a case slower by more than --tolerance
+is reported as a regression (exit status 1). --save replaces the baseline.
+
+Usage:
+    python3 benchmarks/analysis.py
+    python3 benchmarks/analysis.py --years 1 10 --filter lag --repeat 10
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+import numpy as np
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
+import scipy
+from scipy.ndimage import gaussian_filter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from animation import animate_traits, select_frames
+from derived import smoothed_density, snapshot_fits, trait_series
+from fitting import fit_gaussians
+from fortio import memmap_fort, read_fort10, read_fort11, read_fort12
+from hovmoller import plot_hovmoller
+from lag import rolling_seasonal_lag, seasonal_lag
+from runcache import build_run
+from smoothing import smooth_density
+from traits import trait_axis, trait_moments
+
+from baseline import BASELINE_DIR, load_baseline, machine_info, save_baseline, warn_differences
+from synthetic import GENERATOR_VERSION, generate
+
+BASELINE_VERSION = 1 # bump when a benchmark changes what it measures
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DEFAULT_YEARS = (1, 10, 100)
+DAYS_PER_YEAR = 360
+OUTPUT_DT = 86400.0 # fort.* are written once per simulated day
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registers a benchmark: a function of a SyntheticRun returning the callable to time."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class SyntheticRun:
+    """A synthetic output directory and, read once, the arrays the analyses work on."""
+
+    def __init__(self, output_dir, nyears):
+        self.output_dir = output_dir
+        self.nyears = nyears
+        self._data = {}
+
+    def path(self, unit):
+        return os.path.join(self.output_dir, f'fort.{unit}')
+
+    def data(self, unit):
+        """In-memory copy of fort.10/11/12, so analysis timings do not include the read."""
+        if unit not in self._data:
+            reader = {10: read_fort10, 11: read_fort11, 12: read_fort12}[unit]
+            self._data[unit] = np.array(reader(self.path(unit), use_cache=False))
+        return self._data[unit]
+
+    @property
+    def mean_topt(self):
+        if 'mean_topt' not in self._data:
+            self._data['mean_topt'] = trait_moments(self.data(12), fractions=False)['mean']
+        return self._data['mean_topt']
+
+
+@benchmark('read_fort10')
+def bench_read_fort10(run):
+    return lambda: np.asarray(read_fort10(run.path(10), use_cache=False)).sum()
+
+
+@benchmark('read_fort11')
+def bench_read_fort11(run):
+    return lambda: np.asarray(read_fort11(run.path(11), use_cache=False)).sum()
+
+
+@benchmark('read_fort12')
+def bench_read_fort12(run):
+    return lambda: np.asarray(read_fort12(run.path(12), use_cache=False)).sum()
+
+
+@benchmark('runcache_build')
+def bench_runcache_build(run):
+    return lambda: build_run(run.output_dir)
+
+
+@benchmark('read_fort12_cached')
+def bench_read_fort12_cached(run):
+    # The warm-up call builds the store; the rounds load the column from it.
+    return lambda: np.asarray(read_fort12(run.path(12))).sum()
+
+
+@benchmark('trait_moments')
+def bench_trait_moments(run):
+    dist = run.data(12)
+    return lambda: trait_moments(dist)
+
+
+@benchmark('seasonal_lag')
+def bench_seasonal_lag(run):
+    env, trait = run.data(10)[1:, 0], run.mean_topt[1:]
+    return lambda: seasonal_lag(env, trait, step_days=OUTPUT_DT / 86400.0)
+
+
+@benchmark('rolling_seasonal_lag')
+def bench_rolling_seasonal_lag(run):
+    env, trait = run.data(10)[:, 0], run.mean_topt
+    return lambda: rolling_seasonal_lag(env, trait, step_days=OUTPUT_DT / 86400.0)
+
+
+@benchmark('gaussian_smoothing')
+def bench_gaussian_smoothing(run):
+    dist = run.data(12)
+    return lambda: gaussian_filter(dist.T.astype(float), sigma=(1.0, 1.0))
+
+
+@benchmark('tiled_smoothing')
+def bench_tiled_smoothing(run):
+    """smooth_density of the memory-mapped fort.12, written to a .npy file."""
+    dist = memmap_fort(run.path(12), 12)['nbr_cls']
+    filename = os.path.join(run.output_dir, 'benchmark_density.npy')
+    return lambda: smooth_density(dist, sigma=(1.0, 1.0), filename=filename)
+
+
+@benchmark('hovmoller_pcolormesh')
+def bench_hovmoller(run):
+    """Smoothing and rendering of plot_beckmann_heatmap (plot_results.py), saved to memory at 100 dpi."""
+    dist = run.data(12)
+    env = run.data(10)
+
+    def render():
+        time_days = np.arange(dist.shape[0]) * (OUTPUT_DT / 86400.0)
+        smooth_matrix = gaussian_filter(dist.T.astype(float), sigma=(1.0, 1.0))
+        smooth_matrix[smooth_matrix < 0.1] = 0.1
+        fig, ax = plt.subplots(figsize=(10, 6))
+        X, Y = np.meshgrid(time_days, trait_axis(dist.shape[1]))
+        c = ax.pcolormesh(X, Y, smooth_matrix, cmap='YlOrRd', shading='gouraud',
+                          norm=LogNorm(vmin=1.0, vmax=smooth_matrix.max()))
+        ax.plot(time_days, env[:, 0], color='black', linewidth=2.0, linestyle='--')
+        ax.set_ylim(8, 22)
+        plt.colorbar(c)
+        fig.savefig(io.BytesIO(), format='png', dpi=100)
+        plt.close(fig)
+    return render
+
+
+@benchmark('hovmoller_raster')
+def bench_hovmoller_raster(run):
+    """The hovmoller_pcolormesh case as plot_results.py now draws it: smooth_density and plot_hovmoller."""
+    dist = run.data(12)
+    env = run.data(10)
+
+    def render():
+        time_days = np.arange(dist.shape[0]) * (OUTPUT_DT / 86400.0)
+        smooth_matrix = smooth_density(dist, sigma=(1.0, 1.0))
+        smooth_matrix[smooth_matrix < 0.1] = 0.1
+        fig, ax = plt.subplots(figsize=(10, 6))
+        c = plot_hovmoller(ax, smooth_matrix, time_days, trait_axis(dist.shape[1]), dpi=100, cmap='YlOrRd',
+                           norm=LogNorm(vmin=1.0, vmax=smooth_matrix.max()))
+        ax.plot(time_days, env[:, 0], color='black', linewidth=2.0, linestyle='--')
+        ax.set_ylim(8, 22)
+        plt.colorbar(c)
+        fig.savefig(io.BytesIO(), format='png', dpi=100)
+        plt.close(fig)
+    return render
+
+
+@benchmark('animation_gif')
+def bench_animation(run):
+    """Streamed GIF of the trait histogram (plot_results.py), one frame per 10 simulated days."""
+    dist = run.data(12)
+    filename = os.path.join(run.output_dir, 'benchmark_animation.gif')
+    return lambda: animate_traits(dist, filename, frames=range(0, dist.shape[0], 10))
+
+
+@benchmark('select_frames')
+def bench_select_frames(run):
+    """Adaptive frame selection of the trait animation (Wasserstein distance to the last frame)."""
+    dist = run.data(12)
+    return lambda: select_frames(dist)
+
+
+@benchmark('fit_snapshots')
+def bench_fit_snapshots(run):
+    """Gaussian fits of one trait snapshot per simulated month."""
+    snapshots = run.data(12)[30::30]
+    return lambda: fit_gaussians(snapshots)
+
+
+@benchmark('derived_cache_hit')
+def bench_derived_cache_hit(run):
+    """Smoothed density, trait moments and all snapshot fits served by a warm derived cache."""
+    fort12 = run.path(12)
+
+    def load():
+        return smoothed_density(fort12), trait_series(fort12), snapshot_fits(fort12)
+    load()
+    return load
+
+
+@benchmark('hindcast_stats')
+def bench_hindcast_stats(run):
+    """The statistics of plot_hindcast.py: annual means, period mean / peak and the lag drift table."""
+    phyt = run.data(11)[:, 2]
+    env, trait = run.data(10)[:, 0], run.mean_topt
+
+    def stats():
+        n_years = phyt.shape[0] // DAYS_PER_YEAR
+        annual = phyt[:n_years * DAYS_PER_YEAR].reshape(n_years, DAYS_PER_YEAR).mean(axis=1)
+        periods = [(0, 5), (max(run.nyears - 5, 0), run.nyears)]
+        table = [(phyt[a * DAYS_PER_YEAR:b * DAYS_PER_YEAR].mean(), phyt[a * DAYS_PER_YEAR:b * DAYS_PER_YEAR].max())
+                 for a, b in periods]
+        return annual, table, rolling_seasonal_lag(env, trait, step_days=OUTPUT_DT / 86400.0)
+    return stats
+
+
+def measure(func, repeat=5, max_seconds=5.0):
+    """Timing statistics of func: a warm-up call, then repeat rounds (one if the warm-up exceeded max_seconds)."""
+    t0 = time.perf_counter()
+    func()
+    warmup = time.perf_counter() - t0
+    if warmup > max_seconds:
+        rounds = [warmup]
+    else:
+        rounds = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            func()
+            rounds.append(time.perf_counter() - t0)
+    return {'min_s': min(rounds), 'median_s': statistics.median(rounds), 'mean_s': statistics.fmean(rounds),
+            'stddev_s': statistics.stdev(rounds) if len(rounds) > 1 else 0.0, 'rounds': len(rounds)}
+
+
+def _measure_child(connection, name, output_dir, nyears, repeat, max_seconds):
+    try:
+        stats = measure(BENCHMARKS[name](SyntheticRun(output_dir, nyears)), repeat, max_seconds)
+        stats['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0 # kilobytes on Linux
+    except Exception as e:
+        stats = {'error': f"{type(e).__name__}: {e}"}
+    connection.send(stats)
+    connection.close()
+
+
+def measure_isolated(name, output_dir, nyears, repeat=5, max_seconds=5.0):
+    """measure() of one benchmark in a forked child; {'error': ...} if it raises or is killed."""
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    child = context.Process(target=_measure_child, args=(sender, name, output_dir, nyears, repeat, max_seconds))
+    child.start()
+    sender.close()
+    try:
+        stats = receiver.recv()
+    except EOFError: # the child died without reporting
+        stats = None
+    child.join()
+    if stats is None:
+        killed = ' (killed, out of memory?)' if child.exitcode == -9 else ''
+        stats = {'error': f"exit status {child.exitcode}{killed}"}
+    return stats
+
+
+def run_benchmarks(years=DEFAULT_YEARS, names=None, repeat=5, max_seconds=5.0, data_dir=DATA_DIR):
+    """Runs the selected benchmarks on every synthetic run length; returns the baseline document."""
+    names = names or list(BENCHMARKS)
+    results = []
+    for nyears in years:
+        t0 = time.perf_counter()
+        output_dir = generate(os.path.join(data_dir, f'years_{nyears}'), nyears)
+        print(f"{nyears} years: {output_dir} ({time.perf_counter() - t0:.1f} s to prepare)")
+        for name in names:
+            stats = measure_isolated(name, output_dir, nyears, repeat, max_seconds)
+            results.append(dict({'name': name, 'years': nyears}, **stats))
+            if 'error' in stats:
+                print(f"  {name:<22} failed: {stats['error']}", flush=True)
+            else:
+                print(f"  {name:<22} {format_seconds(stats['min_s']):>10} min "
+                      f"({format_seconds(stats['median_s'])} median, {stats['rounds']} rounds, "
+                      f"{stats['peak_rss_mb']:.0f} MB peak)", flush=True)
+
+    document = {'version': BASELINE_VERSION, 'generator_version': GENERATOR_VERSION}
+    document.update(machine_info(os.cpu_count()))
+    document.update({
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'matplotlib': matplotlib.__version__,
+        'config': {'repeat': repeat, 'max_seconds': max_seconds},
+        'results': results,
+    })
+    return document
+
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1.0:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def compare(current, baseline, tolerance=0.25):
+    """
+    [(name, years, baseline min, current min, relative change)] of the
+    cases both documents hold, and the subset slower by more than
+    tolerance. Raises ValueError if the baseline has another schema or
+    generator version, where the timings are not comparable.
+    """
+    for field in ('version', 'generator_version'):
+        if baseline.get(field) != current[field]:
+            raise ValueError(f"Baseline has {field} {baseline.get(field)}, expected {current[field]}")
+    warn_differences(current, baseline, ('host', 'cpu', 'python', 'numpy', 'scipy', 'matplotlib'))
+
+    reference = {(r['name'], r['years']): r['min_s'] for r in baseline['results'] if 'min_s' in r}
+    rows = []
+    for r in current['results']:
+        key = (r['name'], r['years'])
+        if key in reference and 'min_s' in r:
+            rows.append(key + (reference[key], r['min_s'], r['min_s'] / reference[key] - 1.0))
+    return rows, [row for row in rows if row[4] > tolerance]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis code on synthetic wcm.x output.")
+    parser.add_argument('--years', type=int, nargs='+', default=list(DEFAULT_YEARS),
+                        help="Lengths of the synthetic runs in simulated years")
+    parser.add_argument('--filter', default=None, help="Only benchmarks whose name contains this text")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed rounds per benchmark")
+    parser.add_argument('--max-seconds', type=float, default=5.0,
+                        help="Measure once if the warm-up call takes longer than this")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Where the synthetic runs are generated")
+    parser.add_argument('--baseline', default=os.path.join(BASELINE_DIR, 'analysis.json'))
+    parser.add_argument('--save', action='store_true', help="Write the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Relative slow-down of the fastest round reported as a regression")
+    parser.add_argument('--list', action='store_true', help="List the benchmarks")
+    args = parser.parse_args()
+
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        return
+    names = [name for name in BENCHMARKS if args.filter is None or args.filter in name]
+    if not names:
+        parser.error(f"No benchmark matches {args.filter!r}")
+
+    current = run_benchmarks(args.years, names, args.repeat, args.max_seconds, args.data_dir)
+
+    regressions = []
+    baseline = load_baseline(args.baseline)
+    if baseline is not None:
+        try:
+            rows, regressions = compare(current, baseline, args.tolerance)
+        except ValueError as e:
+            print(f"Not compared with {args.baseline}: {e}")
+            rows = []
+        if rows:
+            print(f"Compared with {args.baseline} ({baseline['created']}, {baseline.get('git_commit')}):")
+            for name, years, before, after, change in rows:
+                flag = '  REGRESSION' if change > args.tolerance else ''
+                print(f"  {name:<22} {years:>4d} y: {format_seconds(before):>10} -> {format_seconds(after):>10} "
+                      f"({100 * change:+.1f}%){flag}")
+    if args.save:
+        save_baseline(current, args.baseline)
+        print(f"Generated {args.baseline}")
+    if regressions and not args.save:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
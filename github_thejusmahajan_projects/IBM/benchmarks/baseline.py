@@ -0,0 +1,72 @@
+"""
+Versioned JSON baselines shared by the benchmarks.
+
+A baseline records the machine and software it was measured with next to
+the timings, so a comparison can warn when it is not like for like. The
+files in baselines/ are committed; `--save` of a benchmark replaces one.
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or 'unknown'
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine_info(cores):
+    """Creation time, host, CPU, core count and commit of a baseline."""
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': platform.node(),
+        'cpu': cpu_model(),
+        'cores': cores,
+        'git_commit': git_commit(),
+    }
+
+
+def warn_differences(current, baseline, fields):
+    for field in fields:
+        if baseline.get(field) != current.get(field):
+            print(f"Warning: {field} differs from the baseline ({baseline.get(field)!r} vs {current.get(field)!r})")
+
+
+def _json_value(value):
+    # NaN (e.g. an efficiency without a one-thread run) is not valid JSON
+    return None if isinstance(value, float) and value != value else value
+
+
+def save_baseline(document, filename):
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    document = dict(document, results=[{key: _json_value(value) for key, value in r.items()}
+                                       for r in document['results']])
+    with open(filename, 'w') as f:
+        json.dump(document, f, indent=1)
+        f.write('\n')
+
+
+def load_baseline(filename):
+    """The baseline document, or None if there is none yet."""
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        return json.load(f)
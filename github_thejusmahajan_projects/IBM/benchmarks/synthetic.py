@@ -0,0 +1,142 @@
+"""
+Synthetic wcm.x output for benchmarking the analysis scripts.
+
+Writes fort.10 - fort.14 in the exact record layout of wcm.x (see
+fortio.py): one initial record and one per simulated day, framed by
+gfortran's 4-byte length markers. The series imitate a SEASONAL_TEMP run
+of beckmann_2019 at about 1e5 agents: temperature 15 +/- 5 degC over a
+360-day year, nutrient, detritus and phytoplankton pools with a seasonal
+ripple, a T_opt histogram that follows the temperature with a lag of about
+a month and a third of its amplitude (Poisson counts in the 0.1 degC
+bins), a steadily rising generation range and the matching Eulerian
+strain biomass. Records are generated and written a year at a time, so a
+100-year run needs no more memory than a 1-year one. The content depends
+only on nyears, the seed and the generator version; generate() leaves an
+existing run with the same stamp in place.
+
+Usage:
+    python3 benchmarks/synthetic.py benchmarks/data/years_100 --nyears 100
+"""
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from fortio import record_dtype
+from traits import trait_axis
+
+GENERATOR_VERSION = 1 # bump when the synthetic series change
+STAMP_NAME = 'synthetic.json'
+DAYS_PER_YEAR = 360
+MS = 200 # trait classes 0..Ms, as in wcm_arrays.f90
+UNITS = (10, 11, 12, 13, 14)
+
+
+def _framed(unit, n_records, n_bins=MS + 1):
+    payload = {10: 16, 11: 24, 12: n_bins * 4 + 16, 13: 8, 14: n_bins * 8 + 8}[unit]
+    records = np.zeros(n_records, dtype=record_dtype(unit, payload))
+    records['head'] = payload
+    records['tail'] = payload
+    return records
+
+
+def synthetic_days(days, rng, n_agents=1e5, lag_days=30.0, amp_ratio=0.33, sigma=1.0):
+    """{unit: structured records} of wcm.x output on the given simulated days (day >= 1)."""
+    n = days.shape[0]
+    phase = 2.0 * np.pi * days / DAYS_PER_YEAR
+    temp = 15.0 + 5.0 * np.sin(phase)
+    x = trait_axis(MS + 1)
+
+    out = {unit: _framed(unit, n) for unit in UNITS}
+    out[10]['data'][:, 0] = temp
+    out[10]['data'][:, 1] = 100.0
+
+    aorg = 0.028 + 0.008 * np.sin(phase + 0.5) + 0.002 * rng.standard_normal(n)
+    detr = 1.422 + 0.004 * rng.standard_normal(n)
+    out[11]['data'][:, 0] = np.abs(aorg)
+    out[11]['data'][:, 1] = detr
+    out[11]['data'][:, 2] = 5.0087 - np.abs(aorg) - detr
+
+    mean = 15.0 + amp_ratio * 5.0 * np.sin(phase - 2.0 * np.pi * lag_days / DAYS_PER_YEAR) \
+        + 0.1 * rng.standard_normal(n)
+    width = sigma * (1.0 + 0.05 * rng.standard_normal(n))
+    density = np.exp(-0.5 * ((x[np.newaxis, :] - mean[:, np.newaxis]) / width[:, np.newaxis])**2)
+    density /= density.sum(axis=1, keepdims=True)
+    agents = n_agents * (0.987 + 0.003 * rng.standard_normal(n))
+    out[12]['nbr_cls'] = rng.poisson(agents[:, np.newaxis] * density)
+    out[12]['growthmean0'] = 0.1044 + 0.0005 * rng.standard_normal(n)
+    out[12]['growthmean'] = 0.067 + 0.006 * np.sin(phase) + 0.001 * rng.standard_normal(n)
+
+    gen_min = 1 + np.floor(days * 51.0 / DAYS_PER_YEAR)
+    out[13]['data'][:, 0] = gen_min
+    out[13]['data'][:, 1] = gen_min + 12 + np.floor(days / DAYS_PER_YEAR)
+
+    out[14]['strain'] = density * out[11]['data'][:, 2:3]
+    out[14]['growthmean0'] = out[12]['growthmean0']
+    return out
+
+
+def _initial_records():
+    """Record 0, written before the time loop: 500 agents at T_opt 15, no forcing yet."""
+    out = {unit: _framed(unit, 1) for unit in UNITS}
+    out[11]['data'][0] = (4.99, 0.0, 0.01865656)
+    out[12]['nbr_cls'][0, 95:106] = 500 // 11
+    out[12]['nbr_cls'][0, 100] += 500 - 11 * (500 // 11)
+    out[13]['data'][0] = (1, 1)
+    out[14]['strain'][0, 95:106] = 0.01865656 / 11
+    return out
+
+
+def read_stamp(output_dir):
+    path = os.path.join(output_dir, STAMP_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def generate(output_dir, nyears, seed=0):
+    """
+    Writes a synthetic run of nyears to output_dir (fort.10 - fort.14) unless
+    one with the same stamp is already there; returns output_dir.
+    """
+    stamp = {'version': GENERATOR_VERSION, 'nyears': int(nyears), 'seed': int(seed)}
+    if read_stamp(output_dir) == stamp and all(os.path.exists(os.path.join(output_dir, f'fort.{unit}'))
+                                               for unit in UNITS):
+        return output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    # The stamp is written last, so an interrupted generation is redone.
+    if os.path.exists(os.path.join(output_dir, STAMP_NAME)):
+        os.remove(os.path.join(output_dir, STAMP_NAME))
+
+    rng = np.random.default_rng(seed)
+    files = {unit: open(os.path.join(output_dir, f'fort.{unit}'), 'wb') for unit in UNITS}
+    try:
+        for unit, records in _initial_records().items():
+            records.tofile(files[unit])
+        for year in range(nyears):
+            days = year * DAYS_PER_YEAR + np.arange(1, DAYS_PER_YEAR + 1, dtype=np.float64)
+            for unit, records in synthetic_days(days, rng).items():
+                records.tofile(files[unit])
+    finally:
+        for f in files.values():
+            f.close()
+    with open(os.path.join(output_dir, STAMP_NAME), 'w') as f:
+        json.dump(stamp, f)
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic wcm.x output (fort.10 - fort.14).")
+    parser.add_argument('output_dir')
+    parser.add_argument('--nyears', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.output_dir, args.nyears, args.seed)
+    print(f"Generated {args.nyears} years in {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+OpenMP thread-scaling benchmark of wcm.x.
+
+The growth and mortality loops of phyt_ibm.F90 run in parallel, while cell
+division, array_adjust and the daily binning in wcm.F90 are serial, so the
+speed-up from OMP_NUM_THREADS depends on the number of agents. This harness
+runs one fixed short configuration (the study's parameters.nml with nyears
+and seed pinned) for every combination of agent load and thread count.
+The load is set at compile time: the population settles at about M agents,
+so each load is a cached build (builds.py) with M and M2 scaled
+accordingly. Every run happens in a scratch directory through
+ensemble.run_job; the fastest of --repeat runs is kept.
+
+Per load and thread count the table reports wall time, simulated days per
+wall second, speed-up over one thread, parallel efficiency T1 / (p Tp) and
+the Karp-Flatt serial fraction. --save writes the results to a JSON
+baseline (schema version, host, CPU, compiler, flags, git commit) that is
+meant to be committed; later runs are compared against it, and a
+configuration slower than the baseline by more than --tolerance is
+reported as a regression (exit status 1). --save is refused on a
+single-core host and for thread counts above the available cores, whose
+oversubscribed timings would make a misleading baseline.
+
+Usage (from a study directory):
+    python3 ../../benchmarks/thread_scaling.py --save
+    python3 ../../benchmarks/thread_scaling.py --agents 500 100000 --threads 1 2 4 8 --repeat 3
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from builds import build, build_info, compiler_version, makefile_settings, read_parameters
+from ensemble import available_cores, make_job, run_job
+from namelist import Namelist
+from runlog import read_log
+
+from baseline import BASELINE_DIR, load_baseline, machine_info, save_baseline, warn_differences
+
+BASELINE_VERSION = 1 # bump when the configuration or the meaning of a field changes
+DAYS_PER_YEAR = 360
+DEFAULT_AGENTS = (500, 100000)
+
+
+def default_thread_counts(cores=None):
+    """1, 2, 4, ... up to the available cores, plus the core count itself."""
+    cores = cores or available_cores()
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def load_sizes(agents, src_dir='src'):
+    """
+    {M, M2} of a build holding about `agents` agents: M = agents, and M2
+    keeps the ratio M2 / M of the sources (headroom for divisions).
+    """
+    with open(os.path.join(src_dir, 'wcm_arrays.f90')) as f:
+        sizes = read_parameters(f.read())
+    return {'M': int(agents), 'M2': int(round(agents * sizes['M2'] / sizes['M']))}
+
+
+def benchmark_namelist(text, nyears=1, seed=1):
+    """The study namelist with run length and seed pinned, so every run does the same work."""
+    namelist = Namelist(text)
+    return namelist.render({'nyears': nyears, 'seed' if 'seed' in namelist else 'model_params.seed': seed})
+
+
+def time_run(binary, job, threads, scratch):
+    """Manifest of one run in a fresh directory, with the agent statistics of its log; output is discarded."""
+    run_dir = tempfile.mkdtemp(prefix='run.', dir=scratch)
+    try:
+        manifest = run_job(binary, run_dir, job, threads)
+        rows = read_log(os.path.join(run_dir, 'run.log'))
+        if rows is not None and rows.shape[0]:
+            manifest['mean_agents'] = float(rows['alive'].mean())
+            manifest['max_m2max'] = int(rows['m2max'].max())
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return manifest
+
+
+def scaling_metrics(results):
+    """Adds speed-up, efficiency and Karp-Flatt serial fraction to results of one load (sorted by threads)."""
+    serial = next((r['wall_time_s'] for r in results if r['threads'] == 1), np.nan)
+    for r in results:
+        p = r['threads']
+        speedup = serial / r['wall_time_s']
+        r['speedup'] = speedup
+        r['efficiency'] = speedup / p
+        # Karp-Flatt: the serial fraction that explains the measured speed-up
+        r['serial_fraction'] = (1.0 / speedup - 1.0 / p) / (1.0 - 1.0 / p) if p > 1 else np.nan
+    return results
+
+
+def run_benchmark(agents=DEFAULT_AGENTS, thread_counts=None, nyears=1, repeat=1, seed=1,
+                  src_dir='src', namelist_file='parameters.nml', makefile='Makefile', cache_dir=None):
+    """Times every load x thread count; returns the baseline document (see module docstring)."""
+    thread_counts = sorted(set(thread_counts or default_thread_counts()))
+    with open(namelist_file) as f:
+        job = make_job(benchmark_namelist(f.read(), nyears, seed), label='bench')
+    sim_days = nyears * DAYS_PER_YEAR
+    fc, fflags = makefile_settings(makefile)
+
+    results = []
+    scratch = tempfile.mkdtemp(prefix='wcm_bench.')
+    try:
+        for n_agents in agents:
+            binary = build(src_dir, cache_dir=cache_dir, makefile=makefile, parameters=load_sizes(n_agents, src_dir))
+            load = []
+            for threads in thread_counts:
+                runs = []
+                for _ in range(repeat):
+                    manifest = time_run(binary, job, threads, scratch)
+                    if manifest['status'] != 'done':
+                        raise RuntimeError(f"wcm.x failed at {n_agents} agents, {threads} threads "
+                                           f"(exit status {manifest['returncode']})")
+                    runs.append(manifest)
+                best = min(runs, key=lambda m: m['wall_time_s'])
+                entry = {
+                    'agents': int(n_agents),
+                    'threads': threads,
+                    'build_key': build_info(binary)['key'],
+                    'wall_time_s': best['wall_time_s'],
+                    'wall_times_s': [m['wall_time_s'] for m in runs],
+                    'sim_days_per_s': sim_days / best['wall_time_s'],
+                    'mean_agents': best.get('mean_agents'),
+                    'max_m2max': best.get('max_m2max'),
+                    'peak_rss_kb': best['peak_rss_kb'],
+                }
+                load.append(entry)
+                print(f"  {n_agents:>7d} agents x {threads:2d} threads: {entry['wall_time_s']:8.2f} s, "
+                      f"{entry['sim_days_per_s']:8.1f} sim-days/s, mean {entry['mean_agents'] or 0:.0f} agents",
+                      flush=True)
+            results.extend(scaling_metrics(load))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    document = {'version': BASELINE_VERSION, 'study': os.path.basename(os.getcwd())}
+    document.update(machine_info(available_cores()))
+    document.update({
+        'fc': fc,
+        'compiler_version': compiler_version(fc),
+        'fflags': fflags,
+        'config': {'nyears': nyears, 'seed': seed, 'sim_days': sim_days, 'repeat': repeat},
+        'results': results,
+    })
+    return document
+
+
+def compare(current, baseline, tolerance=0.10):
+    """
+    [(agents, threads, baseline s, current s, relative change)] of the
+    configurations both documents hold, and the subset slower by more than
+    tolerance. Raises ValueError if the baseline has another schema version
+    or configuration, where the timings are not comparable.
+    """
+    if baseline.get('version') != current['version']:
+        raise ValueError(f"Baseline has version {baseline.get('version')}, expected {current['version']}")
+    if baseline['config']['sim_days'] != current['config']['sim_days']:
+        raise ValueError(f"Baseline simulates {baseline['config']['sim_days']} days, this run "
+                         f"{current['config']['sim_days']}")
+    warn_differences(current, baseline, ('host', 'cpu', 'cores', 'compiler_version', 'fflags'))
+
+    reference = {(r['agents'], r['threads']): r['wall_time_s'] for r in baseline['results']}
+    rows = []
+    for r in current['results']:
+        key = (r['agents'], r['threads'])
+        if key in reference:
+            rows.append(key + (reference[key], r['wall_time_s'], r['wall_time_s'] / reference[key] - 1.0))
+    return rows, [row for row in rows if row[4] > tolerance]
+
+
+def format_table(document):
+    lines = [f"{'agents':>8} {'threads':>7} {'wall s':>9} {'sim-d/s':>9} {'speedup':>8} {'effic.':>7} "
+             f"{'serial':>7} {'RSS MB':>7}"]
+    for r in document['results']:
+        lines.append(f"{r['agents']:>8d} {r['threads']:>7d} {r['wall_time_s']:>9.2f} {r['sim_days_per_s']:>9.1f} "
+                     f"{r['speedup']:>8.2f} {r['efficiency']:>7.2f} {r['serial_fraction']:>7.3f} "
+                     f"{r['peak_rss_kb'] / 1024:>7.0f}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thread-scaling benchmark of wcm.x at several agent loads.")
+    parser.add_argument('--agents', type=int, nargs='+', default=list(DEFAULT_AGENTS),
+                        help="Agent loads, each a build with M set to it")
+    parser.add_argument('--threads', type=int, nargs='+', default=None,
+                        help="OMP_NUM_THREADS values (default: 1, 2, 4, ... up to the cores)")
+    parser.add_argument('--nyears', type=int, default=1, help="Simulated years per run")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per configuration; the fastest counts")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--src', default='src', help="Source directory")
+    parser.add_argument('--namelist', default='parameters.nml')
+    parser.add_argument('--cache-dir', default=None, help="Build cache (default: $WCM_BUILD_CACHE or builds/)")
+    parser.add_argument('--baseline', default=None,
+                        help="Baseline JSON (default: benchmarks/baselines/thread_scaling_<study>.json)")
+    parser.add_argument('--save', action='store_true', help="Write the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="Relative slow-down reported as a regression")
+    args = parser.parse_args()
+
+    cores = available_cores()
+    if args.threads and max(args.threads) > cores:
+        if args.save:
+            # Oversubscribed timings measure the host, not the OpenMP code; a baseline of them misleads every comparison
+            parser.error(f"--save needs --threads within the {cores} available cores; record the baseline "
+                         "on a host with enough cores")
+        print(f"Warning: more threads than the {cores} available cores; those timings are oversubscribed")
+    if args.save and cores < 2:
+        parser.error("--save needs a host with at least 2 cores; a single-core run has no scaling to record")
+    baseline_file = args.baseline or os.path.join(BASELINE_DIR, f"thread_scaling_{os.path.basename(os.getcwd())}.json")
+
+    current = run_benchmark(args.agents, args.threads, args.nyears, args.repeat, args.seed,
+                            args.src, args.namelist, cache_dir=args.cache_dir)
+    print(format_table(current))
+
+    regressions = []
+    baseline = load_baseline(baseline_file)
+    if baseline is not None:
+        try:
+            rows, regressions = compare(current, baseline, args.tolerance)
+        except ValueError as e:
+            print(f"Not compared with {baseline_file}: {e}")
+            rows = []
+        if rows:
+            print(f"Compared with {baseline_file} ({baseline['created']}, {baseline.get('git_commit')}):")
+            for agents, threads, before, after, change in rows:
+                flag = '  REGRESSION' if change > args.tolerance else ''
+                print(f"  {agents:>7d} agents x {threads:2d} threads: {before:8.2f} s -> {after:8.2f} s "
+                      f"({100 * change:+.1f}%){flag}")
+    if args.save:
+        save_baseline(current, baseline_file)
+        print(f"Generated {baseline_file}")
+    if regressions and not args.save:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""
+Animation of the T_opt trait histogram (fort.12) without intermediate files.
+
+One figure is built; every frame only replaces the heights of the
+histogram (a StepPatch, drawn like plt.bar with align='edge') and the
+time label, and blits them onto a copy of the static background (axes,
+ticks, labels) taken once. The pixel buffer of each frame goes straight to
+a streaming writer: ffmpeg reading raw video on a pipe for .mp4 / .webm, or
+a GIF writer that encodes one frame at a time with Pillow and appends it
+to the file, so neither PNG frames nor the whole animation are ever held
+on disk or in memory. With workers > 1 the frame range is split into
+contiguous segments rendered by separate processes and joined at the end.
+
+Instead of a fixed stride, select_frames picks the records to show by how
+much the distribution has changed: a record becomes a frame once its
+distance (L1 of the bin fractions, or the Wasserstein-1 distance in degC)
+to the last frame passes a threshold, or max_gap records after it at the
+latest. Fast adaptation after a temperature jump is then shown day by
+day while near-steady months pass in a few frames; the simulated time is
+printed on every frame.
+
+Usage (from a study directory):
+    python3 ../../common/animation.py output/fort.12 plots/animation.gif
+    python3 ../../common/animation.py output/fort.12 plots/animation.mp4 --fps 30 --workers 4
+    python3 ../../common/animation.py output/fort.12 plots/animation.gif --adaptive --metric l1
+"""
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from fortio import read_fort12
+from traits import TRAIT_WIDTH, trait_axis
+
+DAYS_PER_YEAR = 360
+METRICS = ('wasserstein', 'l1')
+# Change that triggers a frame: 0.05 degC of shift for Wasserstein-1, 10% of the agents moved for L1
+DEFAULT_THRESHOLDS = {'wasserstein': 0.05, 'l1': 0.1}
+FORMATS = ('.gif', '.mp4', '.webm')
+# ffmpeg output options per container; yuv420p needs even frame sizes
+FFMPEG_CODECS = {
+    '.mp4': ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', '23'],
+    '.webm': ['-c:v', 'libvpx-vp9', '-pix_fmt', 'yuv420p', '-crf', '32', '-b:v', '0'],
+}
+
+
+def ffmpeg_path():
+    """The ffmpeg executable matplotlib is configured with, or None if it is not installed."""
+    import matplotlib
+    return shutil.which(matplotlib.rcParams['animation.ffmpeg_path'])
+
+
+class GifWriter:
+    """
+    Streaming animated-GIF writer. Every frame is quantized to the palette
+    of the first frame, cropped to the rectangle that differs from the
+    previous frame, LZW-encoded by Pillow as a single-image GIF, and its
+    image block (with the palette as local colour table) is appended to the
+    file behind a delay / disposal extension. (matplotlib's PillowWriter
+    instead keeps every frame in memory until the animation is finished.)
+    Colours are mapped to the palette through a direct-mapped cache of
+    2^COLOR_CACHE_BITS recently seen colours (the antialiased histogram
+    has a few hundred); a colour missing from it is mapped to the nearest
+    palette entry again.
+
+    Limits: alpha is ignored and an animation has at most the 256 colours
+    of its first frame. Every frame carries its own local colour table
+    (Pillow drops unused entries, so the tables differ in size and order
+    from frame to frame) and disposal method 1, leaving the previous frame
+    in place under the changed rectangle. The file has no global colour
+    table, so its header is always HEADER_SIZE bytes; concat_segments
+    relies on that and joins only files of this writer. The splice expects
+    Pillow's single-image layout (header, optional colour table and
+    extensions, one image block, trailer) and raises ValueError on any
+    other block.
+    """
+    COLOR_CACHE_BITS = 16
+    HEADER_SIZE = 13 + 19 # GIF89a + logical screen descriptor, NETSCAPE2.0 loop extension
+
+    def __init__(self, filename, fps, size, loop=0):
+        self.filename = filename
+        self.size = size
+        self.delay = max(int(round(100.0 / fps)), 2) # hundredths of a second; browsers treat < 2 as 10
+        self.loop = loop
+        self.palette = None
+        self.previous = None
+        # Each cache slot holds colour << 8 | palette index. Colour 0 hashes to slot 0 only, so it marks the
+        # other slots as empty; slot 0 starts with colour 1.
+        self._cache = np.zeros(1 << self.COLOR_CACHE_BITS, dtype=np.uint32)
+        self._cache[0] = 1 << 8
+        self.n_frames = 0
+        self._file = open(filename, 'wb')
+
+    def _indices(self, colors):
+        """Palette indices of packed 0xBBGGRR colours; colours not in the cache get the nearest entry."""
+        flat = colors.ravel().astype(np.uint32, copy=False)
+        # Fibonacci hashing of the colour onto a cache slot
+        slots = flat * np.uint32(0x9E3779B1)
+        slots >>= np.uint32(32 - self.COLOR_CACHE_BITS)
+        cached = self._cache[slots]
+        missing = (cached >> np.uint32(8)) != flat
+        if missing.any():
+            new, inverse = np.unique(flat[missing], return_inverse=True)
+            rgb = np.stack([new & 0xFF, (new >> 8) & 0xFF, (new >> 16) & 0xFF], axis=1).astype(np.int32)
+            distance = ((rgb[:, np.newaxis, :] - self.palette[np.newaxis, :, :])**2).sum(axis=2)
+            entries = (new << np.uint32(8)) | np.argmin(distance, axis=1).astype(np.uint32)
+            cached[missing] = entries[inverse]
+            self._cache[slots[missing]] = entries[inverse]
+        return cached.astype(np.uint8).reshape(colors.shape)
+
+    def write(self, rgba):
+        from PIL import Image
+        width, height = self.size
+        colors = np.frombuffer(rgba, dtype='<u4').reshape(height, width) & 0xFFFFFF
+        if self.palette is None:
+            # Median-cut palette of the first frame; later frames are mapped onto it
+            image = Image.frombuffer('RGBA', self.size, rgba, 'raw', 'RGBA', 0, 1).convert('RGB')
+            quantized = image.quantize(colors=256, dither=Image.Dither.NONE)
+            n_used = int(np.asarray(quantized).max()) + 1
+            self.palette = np.array(quantized.getpalette(), dtype=np.int32).reshape(-1, 3)[:n_used]
+            self._palette_bytes = self.palette.astype(np.uint8).tobytes()
+
+        # Only the changed rectangle is stored; the rest of the previous frame stays on screen.
+        left, top, right, bottom = 0, 0, width, height
+        if self.previous is not None:
+            changed = colors != self.previous
+            rows, cols = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+            if rows.size:
+                left, top, right, bottom = int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+            else: # unchanged frame: one pixel keeps the timing
+                right, bottom = 1, 1
+        self.previous = colors
+        frame = Image.fromarray(self._indices(colors[top:bottom, left:right]))
+        frame.putpalette(self._palette_bytes)
+        buffer = io.BytesIO()
+        frame.save(buffer, format='GIF')
+        data = buffer.getvalue()
+
+        packed = data[10]
+        table_size = 3 * 2 ** ((packed & 7) + 1) if packed & 0x80 else 0
+        table = data[13:13 + table_size]
+        if self.n_frames == 0:
+            # Screen descriptor without a global table, then loop forever (or self.loop times)
+            self._file.write(b'GIF89a' + data[6:10] + bytes([packed & 0x70, 0, 0]))
+            self._file.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + self.loop.to_bytes(2, 'little') + b'\x00')
+        pos = 13 + table_size
+        while data[pos] != 0x3B:
+            if data[pos] == 0x21: # extension written by Pillow: skip its sub-blocks
+                pos += 2
+                while data[pos]:
+                    pos += data[pos] + 1
+                pos += 1
+            elif data[pos] == 0x2C: # image descriptor
+                descriptor = bytearray(data[pos:pos + 10])
+                descriptor[1:5] = left.to_bytes(2, 'little') + top.to_bytes(2, 'little')
+                pos += 10
+                local = b''
+                if not descriptor[9] & 0x80:
+                    descriptor[9] |= 0x80 | (packed & 7)
+                    local = table
+                start = pos + 1 # LZW minimum code size, then sub-blocks up to a zero length
+                pos = start
+                while data[pos]:
+                    pos += data[pos] + 1
+                pos += 1
+                self._file.write(b'\x21\xf9\x04\x04' + self.delay.to_bytes(2, 'little') + b'\x00\x00')
+                self._file.write(bytes(descriptor) + local + data[start - 1:pos])
+            else:
+                raise ValueError(f"Unexpected GIF block 0x{data[pos]:02x} from Pillow")
+        self.n_frames += 1
+
+    def close(self):
+        self._file.write(b'\x3b')
+        self._file.close()
+
+
+class FFmpegWriter:
+    """Streaming .mp4 / .webm writer: raw RGBA frames on the stdin of one ffmpeg process."""
+
+    def __init__(self, filename, fps, size):
+        executable = ffmpeg_path()
+        if executable is None:
+            raise RuntimeError(f"ffmpeg not found, needed for {os.path.splitext(filename)[1]}; write a .gif instead")
+        width, height = size
+        command = [executable, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+                   '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-an',
+                   *FFMPEG_CODECS[os.path.splitext(filename)[1].lower()], filename]
+        self._proc = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self.n_frames = 0
+
+    def write(self, rgba):
+        self._proc.stdin.write(rgba)
+        self.n_frames += 1
+
+    def close(self):
+        self._proc.stdin.close()
+        if self._proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with status {self._proc.returncode}")
+
+
+def open_writer(filename, fps, size):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unsupported animation format {extension}; use one of {', '.join(FORMATS)}")
+    if extension == '.gif':
+        return GifWriter(filename, fps, size)
+    return FFmpegWriter(filename, fps, size)
+
+
+def _fractions(counts):
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum(axis=-1, keepdims=True)
+    return np.divide(counts, total, out=np.zeros_like(counts), where=total > 0)
+
+
+def histogram_distance(reference, block, metric='wasserstein'):
+    """
+    Distance of each histogram of block (n, n_bins) to reference (n_bins,),
+    both normalised to fractions: 'l1' is the summed absolute difference
+    (0 to 2), 'wasserstein' the area between the cumulative distributions
+    in degC.
+    """
+    difference = _fractions(block) - _fractions(reference)
+    if metric == 'l1':
+        return np.abs(difference).sum(axis=-1)
+    if metric == 'wasserstein':
+        return np.abs(np.cumsum(difference, axis=-1)).sum(axis=-1) * TRAIT_WIDTH
+    raise ValueError(f"Unknown metric {metric}; use one of {', '.join(METRICS)}")
+
+
+def select_frames(dist_data, metric='wasserstein', threshold=None, max_gap=30):
+    """
+    Record indices of dist_data (n_steps, n_bins) to animate: the first
+    record, then every record whose distance to the previous frame reaches
+    threshold (default DEFAULT_THRESHOLDS[metric]), with at most max_gap
+    records between frames, and the last record. Only the window after the
+    current frame is read, so a memory-mapped fort.12 is streamed.
+    """
+    threshold = DEFAULT_THRESHOLDS[metric] if threshold is None else threshold
+    max_gap = max(int(max_gap), 1)
+    n_steps = dist_data.shape[0]
+    if n_steps == 0:
+        return np.zeros(0, dtype=int)
+    frames = [0]
+    reference = np.asarray(dist_data[0])
+    while frames[-1] < n_steps - 1:
+        start = frames[-1] + 1
+        window = np.asarray(dist_data[start:min(start + max_gap, n_steps)])
+        over = np.flatnonzero(histogram_distance(reference, window, metric) >= threshold)
+        step = over[0] if over.size else window.shape[0] - 1
+        frames.append(start + step)
+        reference = window[step]
+    return np.array(frames)
+
+
+def frame_label(index, output_dt=86400.0):
+    """Simulated time of record index, e.g. 'Day 725 (Year 2.01)'."""
+    day = index * output_dt / 86400.0
+    return f"Day {day:.0f} (Year {day / DAYS_PER_YEAR:.2f})"
+
+
+def render_segment(frames, labels, filename, fps=10, figsize=(8, 6), dpi=100, ymax=None):
+    """
+    Writes the histograms in frames (n_frames, n_bins) with their time
+    labels to filename through a streaming writer; returns the frame count.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    frames = np.asarray(frames)
+    x_axis = trait_axis(frames.shape[1])
+    edges = np.append(x_axis, x_axis[-1] + TRAIT_WIDTH)
+    if ymax is None:
+        ymax = 1.05 * max(float(frames.max()), 1.0)
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_xlabel('Optimal Temperature (deg C)')
+    ax.set_ylabel('Count')
+    ax.set_title('Phytoplankton Trait Distribution')
+    ax.set_xlim(5, 25)
+    ax.set_ylim(0, ymax)
+    fig.tight_layout()
+    bars = ax.stairs(frames[0], edges, fill=True, color='red', animated=True)
+    label = ax.text(0.98, 0.95, '', transform=ax.transAxes, ha='right', va='top', animated=True)
+
+    # Static parts are drawn once; each frame restores them and draws the two animated artists.
+    canvas.draw()
+    background = canvas.copy_from_bbox(ax.bbox)
+    writer = open_writer(filename, fps, canvas.get_width_height())
+    try:
+        for values, text in zip(frames, labels):
+            canvas.restore_region(background)
+            bars.set_data(values)
+            label.set_text(text)
+            ax.draw_artist(bars)
+            ax.draw_artist(label)
+            canvas.blit(ax.bbox)
+            writer.write(canvas.buffer_rgba())
+    finally:
+        writer.close()
+    return writer.n_frames
+
+
+def _render_job(job):
+    return render_segment(**job)
+
+
+def concat_segments(segments, filename):
+    """Joins segment files of the same format, in order, into filename."""
+    if filename.lower().endswith('.gif'):
+        with open(filename, 'wb') as out:
+            for k, segment in enumerate(segments):
+                with open(segment, 'rb') as f:
+                    data = f.read()
+                # Keep the header of the first segment and the trailer of the last
+                start = 0 if k == 0 else GifWriter.HEADER_SIZE
+                end = len(data) if k == len(segments) - 1 else len(data) - 1
+                out.write(data[start:end])
+        return
+    list_file = filename + '.segments.txt'
+    with open(list_file, 'w') as f:
+        f.writelines(f"file '{os.path.abspath(segment)}'\n" for segment in segments)
+    try:
+        subprocess.run([ffmpeg_path(), '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                        '-i', list_file, '-c', 'copy', filename], check=True)
+    finally:
+        os.remove(list_file)
+
+
+def animate_traits(dist_data, filename, frames=None, fps=10, output_dt=86400.0, figsize=(8, 6), dpi=100,
+                   ymax=None, workers=1):
+    """
+    Animation of the trait histogram dist_data (n_steps, n_bins) at the
+    record indices frames (default: every record) written to filename
+    (.gif, .mp4 or .webm). The y-axis is shared by all frames. Returns the
+    number of frames written.
+    """
+    indices = np.arange(dist_data.shape[0]) if frames is None else np.asarray(frames, dtype=int)
+    if indices.size == 0:
+        raise ValueError("No frames to animate")
+    selected = np.asarray(dist_data[indices])
+    labels = [frame_label(i, output_dt) for i in indices]
+    if ymax is None:
+        ymax = 1.05 * max(float(selected.max()), 1.0)
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    settings = {'fps': fps, 'figsize': figsize, 'dpi': dpi, 'ymax': ymax}
+
+    workers = max(1, min(workers, indices.size))
+    if workers == 1:
+        return render_segment(selected, labels, filename, **settings)
+
+    extension = os.path.splitext(filename)[1]
+    bounds = np.linspace(0, indices.size, workers + 1).astype(int)
+    tmp_dir = tempfile.mkdtemp(prefix='.segments.', dir=os.path.dirname(filename) or '.')
+    try:
+        jobs = [dict(settings, frames=selected[a:b], labels=labels[a:b],
+                     filename=os.path.join(tmp_dir, f'segment_{k:03d}{extension}'))
+                for k, (a, b) in enumerate(zip(bounds[:-1], bounds[1:]))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            n_frames = sum(pool.map(_render_job, jobs))
+        concat_segments([job['filename'] for job in jobs], filename)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return n_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Animate the trait histogram of fort.12.")
+    parser.add_argument('fort12', help="fort.12 of a run")
+    parser.add_argument('output', help="Animation file (.gif, .mp4 or .webm)")
+    parser.add_argument('--every', type=int, default=1, help="Records between frames")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Select frames by the change of the distribution instead of --every")
+    parser.add_argument('--metric', choices=METRICS, default='wasserstein', help="Change measure of --adaptive")
+    parser.add_argument('--threshold', type=float, default=None,
+                        help="Change that triggers a frame (default: 0.05 degC for wasserstein, 0.1 for l1)")
+    parser.add_argument('--max-gap', type=int, default=30, help="Most records between frames with --adaptive")
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=1, help="Processes rendering segments of the frame range")
+    args = parser.parse_args()
+
+    dist_data = read_fort12(args.fort12)
+    if dist_data is None:
+        return
+    if args.adaptive:
+        frames = select_frames(dist_data, args.metric, args.threshold, args.max_gap)
+    else:
+        frames = range(0, dist_data.shape[0], args.every)
+    n_frames = animate_traits(dist_data, args.output, frames, args.fps, dpi=args.dpi, workers=args.workers)
+    print(f"Generated {args.output} ({n_frames} of {dist_data.shape[0]} records)")
+
+
+if __name__ == "__main__":
+    main()
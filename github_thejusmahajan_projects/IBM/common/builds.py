@@ -0,0 +1,305 @@
+"""
+Content-addressed cache of wcm.x builds, one per experiment variant.
+
+The experiment is selected by the #define / #undef lines at the top of the
+.F90 sources (CONSTANT_TEMP, TEMP_JUMP, SEASONAL_TEMP, ALTERNATING_TEMP,
+PHYT_IBM, ...), and `make` rebuilds the one output/wcm.x. Here a variant is
+the source text with those lines switched as requested. It is compiled once
+into builds/<key>/wcm.x, where the key hashes the switched sources, the
+define set, the compiler (and its version) and the flags; asking for the
+same combination again returns the cached binary without running the
+compiler, so runs of different experiments can share a study directory.
+Integer PARAMETERs of wcm_arrays.f90 such as the agent array sizes M and M2
+can be overridden the same way (--set M=500).
+
+Usage (from a study directory):
+    python3 ../../common/builds.py --define TEMP_JUMP
+    python3 ../../common/ensemble.py --define TEMP_JUMP --replicates 8
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+# Compiled in this order, as SRCS in the study Makefiles
+SOURCES = ('wcm_arrays.f90', 'phyt_ibm.F90', 'wcm.F90')
+# Temperature forcings; switching one on switches the others off
+FORCINGS = ('CONSTANT_TEMP', 'TEMP_JUMP', 'SEASONAL_TEMP', 'ALTERNATING_TEMP')
+DEFAULT_FC = 'gfortran'
+DEFAULT_FFLAGS = '-fmax-stack-var-size=32768 -w -O3 -fopenmp'
+BUILD_NAME = 'build.json'
+BINARY_NAME = 'wcm.x'
+
+_DIRECTIVE = re.compile(r'^#(define|undef)[ \t]+(\w+)[ \t]*$', re.MULTILINE)
+_PARAMETER_LINE = re.compile(r'^[ \t]*INTEGER\b[^!\n]*\bPARAMETER\b[^!\n]*::[^!\n]*', re.MULTILINE | re.IGNORECASE)
+_INTEGER_ASSIGN = re.compile(r'\b(\w+)(\s*=\s*)(\d+)\b')
+
+
+def default_cache_dir():
+    return os.environ.get('WCM_BUILD_CACHE', 'builds')
+
+
+def read_defines(text):
+    """{name: on} of the bare #define / #undef lines of a source text."""
+    return {name: kind == 'define' for kind, name in _DIRECTIVE.findall(text)}
+
+
+def configure(text, switches):
+    """The source text with the #define / #undef lines of switches = {name: on} replaced."""
+    def replace(match):
+        name = match.group(2)
+        if name not in switches:
+            return match.group(0)
+        return f"#{'define' if switches[name] else 'undef'} {name}"
+    return _DIRECTIVE.sub(replace, text)
+
+
+def read_parameters(text):
+    """{name: value} of the literal integer PARAMETERs of a source text (e.g. M, M2)."""
+    return {name: int(value) for line in _PARAMETER_LINE.findall(text)
+            for name, _, value in _INTEGER_ASSIGN.findall(line)}
+
+
+def set_parameters(text, parameters):
+    """The source text with the integer PARAMETERs of parameters = {name: value} replaced."""
+    def replace_line(line):
+        def replace(match):
+            name = match.group(1)
+            if name not in parameters:
+                return match.group(0)
+            return f"{name}{match.group(2)}{int(parameters[name])}"
+        return _INTEGER_ASSIGN.sub(replace, line.group(0))
+    return _PARAMETER_LINE.sub(replace_line, text)
+
+
+def resolve_switches(define=(), undef=()):
+    """{name: on} for the requested names, with the other forcings switched off."""
+    switches = {}
+    if any(name in FORCINGS for name in define):
+        switches.update(dict.fromkeys(FORCINGS, False))
+    switches.update(dict.fromkeys(undef, False))
+    switches.update(dict.fromkeys(define, True))
+    return switches
+
+
+def makefile_settings(makefile='Makefile'):
+    """(FC, FFLAGS) of a study Makefile, or the defaults if it cannot be read."""
+    settings = {'FC': DEFAULT_FC, 'FFLAGS': DEFAULT_FFLAGS}
+    if os.path.exists(makefile):
+        with open(makefile) as f:
+            for line in f:
+                match = re.match(r'^(FC|FFLAGS)\s*[:?]?=\s*(.*?)\s*$', line)
+                if match:
+                    settings[match.group(1)] = match.group(2)
+    return settings['FC'], settings['FFLAGS']
+
+
+@functools.lru_cache(maxsize=None)
+def compiler_version(fc):
+    try:
+        out = subprocess.run([fc, '--version'], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return out.splitlines()[0].strip() if out else 'unknown'
+
+
+def variant_sources(src_dir='src', define=(), undef=(), parameters=None):
+    """
+    ({filename: switched text}, {name: on}) of the variant. Raises
+    ValueError for a name that no source has a #define / #undef line (or,
+    in parameters, an integer PARAMETER) for.
+    """
+    sources = {}
+    defines = {}
+    known = {}
+    for name in SOURCES:
+        with open(os.path.join(src_dir, name)) as f:
+            sources[name] = f.read()
+        defines.update(read_defines(sources[name]))
+        known.update(read_parameters(sources[name]))
+
+    parameters = parameters or {}
+    unknown = sorted(name for name in parameters if name not in known)
+    if unknown:
+        raise ValueError(f"No integer PARAMETER {', '.join(unknown)} in {src_dir}")
+    sources = {name: set_parameters(text, parameters) for name, text in sources.items()}
+
+    switches = resolve_switches(define, undef)
+    unknown = sorted(name for name in set(define) | set(undef) if name not in defines)
+    if unknown:
+        raise ValueError(f"No #define/#undef for {', '.join(unknown)} in {src_dir}")
+    switches = {name: on for name, on in switches.items() if name in defines}
+
+    sources = {name: configure(text, switches) for name, text in sources.items()}
+    defines.update(switches)
+    return sources, defines
+
+
+def build_key(sources, defines, fc, fflags):
+    """Content address of a build: switched sources, define set, compiler and flags."""
+    h = hashlib.blake2b(digest_size=10)
+    for name in SOURCES:
+        h.update(name.encode())
+        h.update(b'\0')
+        h.update(sources[name].encode())
+        h.update(b'\0')
+    h.update(' '.join(sorted(name for name, on in defines.items() if on)).encode())
+    h.update(b'\0')
+    h.update(f"{fc}\0{compiler_version(fc)}\0{' '.join(fflags.split())}".encode())
+    return h.hexdigest()
+
+
+def _compile(build_dir, sources, fc, fflags):
+    src = os.path.join(build_dir, 'src')
+    os.makedirs(src)
+    for name, text in sources.items():
+        with open(os.path.join(src, name), 'w') as f:
+            f.write(text)
+    # The same two steps as the Makefile
+    commands = [[fc, '-c', 'src/wcm_arrays.f90', '-o', 'src/wcm_arrays.o'],
+                [fc, *fflags.split(), '-o', BINARY_NAME, *(f'src/{name}' for name in SOURCES), '-Isrc']]
+    with open(os.path.join(build_dir, 'build.log'), 'w') as log:
+        for command in commands:
+            log.write(' '.join(command) + '\n')
+            log.flush()
+            if subprocess.run(command, cwd=build_dir, stdout=log, stderr=subprocess.STDOUT).returncode != 0:
+                return False
+    return True
+
+
+def build(src_dir='src', define=(), undef=(), cache_dir=None, fc=None, fflags=None, makefile='Makefile',
+          parameters=None):
+    """
+    Path of the wcm.x built from src_dir with the given names switched on
+    (define) and off (undef) and the integer PARAMETERs in parameters =
+    {name: value} replaced; compiles only if the cache has no build of
+    this variant yet. Compiler and flags default to those of the Makefile.
+    Raises RuntimeError (with the end of the compiler output) if the
+    compilation fails.
+    """
+    make_fc, make_fflags = makefile_settings(makefile)
+    fc = fc or make_fc
+    fflags = fflags if fflags is not None else make_fflags
+    cache_dir = cache_dir or default_cache_dir()
+
+    sources, defines = variant_sources(src_dir, define, undef, parameters)
+    key = build_key(sources, defines, fc, fflags)
+    build_dir = os.path.join(os.path.abspath(cache_dir), key)
+    binary = os.path.join(build_dir, BINARY_NAME)
+    if os.path.exists(os.path.join(build_dir, BUILD_NAME)):
+        return binary
+
+    # Compile next to the cache and move into place in one rename, so a
+    # concurrent build of the same variant never sees a partial directory.
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f'.{key}.', dir=cache_dir)
+    t0 = time.perf_counter()
+    try:
+        if not _compile(tmp_dir, sources, fc, fflags):
+            with open(os.path.join(tmp_dir, 'build.log')) as f:
+                tail = ''.join(f.readlines()[-20:])
+            raise RuntimeError(f"Build of {key} failed:\n{tail}")
+        for directory in (tmp_dir, os.path.join(tmp_dir, 'src')):
+            for name in os.listdir(directory):
+                if name.endswith(('.o', '.mod')):
+                    os.remove(os.path.join(directory, name))
+        info = {
+            'key': key,
+            'defines': sorted(name for name, on in defines.items() if on),
+            'undefs': sorted(name for name, on in defines.items() if not on),
+            'parameters': {name: int(value) for name, value in sorted((parameters or {}).items())},
+            'fc': fc,
+            'compiler_version': compiler_version(fc),
+            'fflags': fflags,
+            'src_dir': os.path.abspath(src_dir),
+            'built': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'build_time_s': round(time.perf_counter() - t0, 3),
+        }
+        with open(os.path.join(tmp_dir, BUILD_NAME), 'w') as f:
+            json.dump(info, f, indent=1)
+        try:
+            os.rename(tmp_dir, build_dir)
+        except OSError: # another process finished the same build first
+            pass
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"Built {binary} ({', '.join(info['defines'] + [f'{k}={v}' for k, v in info['parameters'].items()])}) "
+          f"in {info['build_time_s']:.1f} s")
+    return binary
+
+
+def build_info(binary):
+    """build.json of a cached binary, or None for a binary not built here (e.g. output/wcm.x)."""
+    path = os.path.join(os.path.dirname(os.path.abspath(binary)), BUILD_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def list_builds(cache_dir=None):
+    """build.json of every cached build, oldest first."""
+    cache_dir = cache_dir or default_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return []
+    builds = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name, BUILD_NAME)
+        if os.path.exists(path):
+            with open(path) as f:
+                builds.append(json.load(f))
+    return sorted(builds, key=lambda info: info['built'])
+
+
+def add_build_arguments(parser):
+    """--define / --undef / --set options of the scripts that run the model."""
+    parser.add_argument('--define', action='append', default=[], metavar='NAME',
+                        help="Run a cached build with this switch on (e.g. TEMP_JUMP) instead of --binary")
+    parser.add_argument('--undef', action='append', default=[], metavar='NAME',
+                        help="Run a cached build with this switch off")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', dest='parameters',
+                        help="Run a cached build with this integer PARAMETER of the sources changed (e.g. M2=1000000)")
+
+
+def parse_parameters(items):
+    """{name: int} of NAME=VALUE strings; raises ValueError for a malformed item."""
+    parameters = {}
+    for item in items:
+        name, sep, value = item.partition('=')
+        if not sep or not re.fullmatch(r'\w+', name.strip()) or not re.fullmatch(r'\s*\d+\s*', value):
+            raise ValueError(f"Expected NAME=INTEGER, got {item!r}")
+        parameters[name.strip()] = int(value)
+    return parameters
+
+
+def binary_from_arguments(args):
+    """The cached variant if --define/--undef/--set were given, else --binary."""
+    if args.define or args.undef or args.parameters:
+        return build(define=args.define, undef=args.undef, parameters=parse_parameters(args.parameters))
+    return args.binary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build (or look up) a cached wcm.x variant.")
+    add_build_arguments(parser)
+    parser.add_argument('--src', default='src', help="Source directory")
+    parser.add_argument('--cache-dir', default=None, help="Build cache (default: $WCM_BUILD_CACHE or builds/)")
+    parser.add_argument('--list', action='store_true', help="List the cached builds")
+    args = parser.parse_args()
+
+    if args.list:
+        for info in list_builds(args.cache_dir):
+            sizes = [f'{name}={value}' for name, value in info.get('parameters', {}).items()]
+            print(f"{info['key']}  {info['built']}  {' '.join(info['defines'] + sizes)}")
+        return
+    print(build(args.src, args.define, args.undef, args.cache_dir, parameters=parse_parameters(args.parameters)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+On-disk memoization of arrays derived from wcm.x output.
+
+plot_fig2/3/4, plot_results and the scripts behind the Quarto reports
+derive the same intermediates from one fort.12: the smoothed density
+field, the series of trait moments (mean T_opt) and the Gaussian fits of
+every snapshot. memoize stores such a result in a derived/ directory next
+to the source file, keyed on the content hash of the source files, the
+name of the function and its parameters, so whichever script runs first
+computes it and the others load it. Source hashes are kept in
+derived/sources.json and only recomputed when a file's size or mtime
+changes (as in runcache). A single array is stored as .npy and returned as
+a read-only memory map, a dict of arrays as .npz and returned as a dict.
+memoize_file does the same for a computation that writes its .npy itself,
+such as the tiled smoothing, so the array is never held in memory whole.
+
+Entries are evicted least recently used first once the directory exceeds
+DERIVED_CACHE_MB megabytes (default 1024); a hit refreshes the entry's
+mtime. Set DERIVED_CACHE=0 in the environment to always recompute.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+
+from fitting import fit_gaussians
+from fortio import read_fort12
+from runcache import content_hash
+from smoothing import smooth_density
+from traits import trait_moments
+
+CACHE_NAME = 'derived'
+CACHE_VERSION = 1 # bump when a derived function changes its result
+CACHE_ENABLED = os.environ.get('DERIVED_CACHE', '1') != '0'
+MAX_BYTES = int(float(os.environ.get('DERIVED_CACHE_MB', '1024')) * 2**20)
+SOURCES_NAME = 'sources.json'
+SUFFIXES = ('.npy', '.npz')
+
+
+def cache_dir(source):
+    """The derived/ directory next to a source file."""
+    return os.path.join(os.path.dirname(os.path.abspath(source)), CACHE_NAME)
+
+
+def source_hash(filename, directory):
+    """Content hash of filename, reused from directory's sources.json while size and mtime match."""
+    st = os.stat(filename)
+    index_path = os.path.join(directory, SOURCES_NAME)
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+    name = os.path.basename(filename)
+    entry = index.get(name)
+    if entry is not None and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+        return entry['hash']
+    index[name] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': content_hash(filename)}
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(index_path + '.tmp', index_path)
+    return index[name]['hash']
+
+
+def _json_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Parameter {value!r} cannot be part of a cache key")
+
+
+def entry_key(hashes, function, parameters):
+    description = json.dumps({'version': CACHE_VERSION, 'sources': hashes, 'function': function,
+                              'parameters': parameters}, sort_keys=True, default=_json_value)
+    return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+
+
+def _load(path):
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    with np.load(path, allow_pickle=False) as store:
+        return {name: store[name] for name in store.files}
+
+
+def _store(directory, key, result):
+    """Writes result under key (to a temporary name first); returns the path."""
+    path = os.path.join(directory, key + ('.npy' if isinstance(result, np.ndarray) else '.npz'))
+    with open(path + '.tmp', 'wb') as f:
+        if isinstance(result, np.ndarray):
+            np.save(f, result)
+        else:
+            np.savez(f, **result)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def evict(directory, max_bytes=None, keep=None):
+    """Removes the least recently used entries of directory until it holds at most max_bytes."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith(SUFFIXES) and path != keep:
+            st = os.stat(path)
+            entries.append((st.st_mtime_ns, st.st_size, path))
+    total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep else 0)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+def _entry(sources, function, parameters):
+    """The cache directory and entry key of a derivation, or None when it is not cached."""
+    sources = [sources] if isinstance(sources, str) else list(sources)
+    if not CACHE_ENABLED:
+        return None
+    directory = cache_dir(sources[0])
+    try:
+        os.makedirs(directory, exist_ok=True)
+        return directory, entry_key([source_hash(source, directory) for source in sources], function, parameters)
+    except OSError as e:
+        print(f"Warning: no derived cache in {directory} ({e}).")
+        return None
+
+
+def _hit(directory, key):
+    for suffix in SUFFIXES:
+        path = os.path.join(directory, key + suffix)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+    return None
+
+
+def memoize(sources, function, parameters, compute, max_bytes=None):
+    """
+    The result of compute() (an array or a dict of arrays), derived from
+    the files sources (a path or a list of paths) by function with the
+    given JSON-serialisable parameters: loaded from the cache next to the
+    first source if present, else computed and stored there. Falls back to
+    compute() when caching is disabled or the directory is not writable.
+    """
+    entry = _entry(sources, function, parameters)
+    if entry is None:
+        return compute()
+    directory, key = entry
+    path = _hit(directory, key)
+    if path is not None:
+        return _load(path)
+
+    result = compute()
+    try:
+        path = _store(directory, key, result)
+        evict(directory, max_bytes, keep=path)
+    except OSError as e:
+        print(f"Warning: could not store {function} in {directory} ({e}).")
+        return result
+    return _load(path)
+
+
+def memoize_file(sources, function, parameters, produce, max_bytes=None):
+    """
+    As memoize for a single array that produce(path) writes to the .npy
+    file path itself (atomically). produce(None) must return the array
+    instead; it is used when caching is disabled or the directory is not
+    writable.
+    """
+    entry = _entry(sources, function, parameters)
+    if entry is None:
+        return produce(None)
+    directory, key = entry
+    path = _hit(directory, key) or os.path.join(directory, key + '.npy')
+    if not os.path.exists(path):
+        try:
+            produce(path)
+            evict(directory, max_bytes, keep=path)
+        except OSError as e:
+            print(f"Warning: could not store {function} in {directory} ({e}).")
+            return produce(None)
+    return _load(path)
+
+
+def _histogram(fort12, dist_data):
+    return read_fort12(fort12) if dist_data is None else dist_data
+
+
+def smoothed_density(fort12, sigma=(1.0, 1.0), dist_data=None):
+    """
+    smooth_density of the histogram in fort12, as a read-only (n_bins,
+    n_steps) float32 array. dist_data, if the caller has read it already,
+    is used on a cache miss instead of reading fort12 again.
+    """
+    # Stored time-major, as smooth_density writes its tiles
+    density = memoize_file(fort12, 'smooth_density', {'sigma': list(sigma)},
+                           lambda path: smooth_density(_histogram(fort12, dist_data), sigma, filename=path).T)
+    return density.T
+
+
+def trait_series(fort12, dist_data=None):
+    """trait_moments of every record of fort12 (count, mean, variance, skewness, kurtosis)."""
+    return memoize(fort12, 'trait_moments', {},
+                   lambda: trait_moments(_histogram(fort12, dist_data), fractions=False))
+
+
+def snapshot_fits(fort12, dist_data=None):
+    """fit_gaussians of every record of fort12."""
+    return memoize(fort12, 'fit_gaussians', {}, lambda: fit_gaussians(_histogram(fort12, dist_data)))
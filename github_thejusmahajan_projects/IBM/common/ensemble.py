@@ -0,0 +1,304 @@
+"""
+Concurrent ensembles of wcm.x in isolated run directories.
+
+`make run` executes the model inside the one shared output/ directory of a
+study, so only one simulation can run at a time. Here every job (a namelist
+plus a replicate number) gets its own directory under runs/, named by a
+hash of the code (sources, defines and flags of a cached build, see
+builds.py, or else the binary itself), of the namelist values and of the
+OpenMP thread count, so identical inputs always map to the same place and
+different ones never collide. The thread count is part of the key because
+every thread draws from its own random stream: a run is bit-identical when
+repeated with the same seed and thread count, but not across thread
+counts. A job whose directory already holds a finished run is not started
+again: its outputs (and the metrics derived from them) are reused. Jobs
+are dispatched to a pool of worker processes; each worker starts one wcm.x
+in its run directory with OMP_NUM_THREADS chosen so that workers x threads
+does not exceed the cores available, and records wall time, peak RSS and
+the captured stdout in run.log. A manifest.json written next to the fort.*
+output describes the run.
+
+Since fort.12/fort.14 are large, runs/ can be given a size budget; the
+least recently used run directories are then evicted after each ensemble.
+
+Usage (from a study directory, after `make`):
+    python3 ../../common/ensemble.py --replicates 8 --threads 2 --budget-gb 20
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from builds import add_build_arguments, binary_from_arguments, build_info
+from namelist import Namelist
+from runcache import CACHE_NAME as FORT_CACHE_NAME, content_hash
+
+MANIFEST_NAME = 'manifest.json'
+LOG_NAME = 'run.log'
+DERIVED_NAME = 'derived' # derived.CACHE_NAME, not imported to keep scipy out of the workers
+DEFAULT_SEED = 1 # seed of wcm.x when parameters.nml has none
+# Size budget of a runs directory in GB, unless given explicitly
+BUDGET_GB = float(os.environ['WCM_RUNS_BUDGET_GB']) if os.environ.get('WCM_RUNS_BUDGET_GB') else None
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def plan_threads(n_jobs, threads=None, cores=None):
+    """
+    (workers, threads per job) for n_jobs so that workers x threads <= cores.
+    Without a thread count the cores are shared evenly between the jobs
+    that can run at once.
+    """
+    cores = cores or available_cores()
+    n_jobs = max(n_jobs, 1)
+    if threads is None:
+        threads = max(1, cores // min(n_jobs, cores))
+    threads = max(1, min(threads, cores))
+    workers = max(1, min(n_jobs, cores // threads))
+    return workers, threads
+
+
+def make_job(namelist, replicate=0, label=None):
+    """
+    One ensemble member: the namelist text it runs with and its replicate
+    number. Replicate N runs with the seed of the namelist + N, so a rerun
+    of a replicate with the same OMP_NUM_THREADS is bit-identical and
+    different replicates draw from independent random streams.
+    """
+    parsed = Namelist(namelist)
+    seed = int(parsed.get('seed', DEFAULT_SEED)) + int(replicate)
+    namelist = parsed.render({'seed' if 'seed' in parsed else 'model_params.seed': seed})
+    return {'namelist': namelist, 'replicate': int(replicate), 'seed': seed,
+            'label': label if label is not None else f'rep{replicate:03d}'}
+
+
+def code_key(binary):
+    """
+    Identity of the model code: the key of a cached build (which covers
+    sources, define set and flags) or else the hash of the binary itself.
+    """
+    build = build_info(binary)
+    return f"build:{build['key']}" if build is not None else f"binary:{content_hash(binary)}"
+
+
+def namelist_key(text):
+    """The namelist values in canonical form, so layout and comments do not change a key."""
+    return json.dumps(Namelist(text).groups, sort_keys=True)
+
+
+def run_key(code, job, threads):
+    """
+    Content address of a job: hash of the code, of everything the job feeds
+    into it and of the thread count its random streams depend on.
+    """
+    h = hashlib.blake2b(digest_size=10)
+    h.update(code.encode())
+    h.update(b'\0')
+    h.update(namelist_key(job['namelist']).encode())
+    h.update(b'\0')
+    h.update(str(job['replicate']).encode())
+    h.update(b'\0')
+    h.update(str(int(threads)).encode())
+    return h.hexdigest()
+
+
+def _prepare_dir(run_dir):
+    os.makedirs(run_dir, exist_ok=True)
+    # A previous attempt may have left partial output (and results derived from it) behind, including the
+    # caches that runcache and derived.py keep next to the fort.* files of a run that has been read.
+    for name in os.listdir(run_dir):
+        path = os.path.join(run_dir, name)
+        if name == DERIVED_NAME or name == FORT_CACHE_NAME or name.startswith(FORT_CACHE_NAME + '.'):
+            shutil.rmtree(path, ignore_errors=True)
+        elif name.startswith('fort.') or name.endswith('.json') or name == LOG_NAME:
+            os.remove(path)
+
+
+def run_job(binary, run_dir, job, threads, key=None, extra_manifest=None):
+    """
+    Runs wcm.x once in run_dir and returns its manifest. Executed inside a
+    pool worker; peak RSS is taken from wait4 on the model process itself.
+    """
+    _prepare_dir(run_dir)
+    with open(os.path.join(run_dir, 'parameters.nml'), 'w') as f:
+        f.write(job['namelist'])
+
+    # Unbuffered stdout keeps run.log current for runlog.py --follow
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads), GFORTRAN_UNBUFFERED_PRECONNECTED='y')
+    started = time.time()
+    t0 = time.perf_counter()
+    with open(os.path.join(run_dir, LOG_NAME), 'wb') as log:
+        proc = subprocess.Popen([os.path.abspath(binary)], cwd=run_dir, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time.perf_counter() - t0
+
+    manifest = {
+        'key': key,
+        'label': job['label'],
+        'replicate': job['replicate'],
+        'seed': job.get('seed'),
+        'binary': os.path.abspath(binary),
+        'omp_num_threads': threads,
+        'host': platform.node(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+        'wall_time_s': round(wall_time, 3),
+        'peak_rss_kb': usage.ru_maxrss, # kilobytes on Linux
+        'returncode': proc.returncode,
+        'status': 'done' if proc.returncode == 0 else 'failed',
+    }
+    manifest.update(extra_manifest or {})
+    with open(os.path.join(run_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def read_manifest(run_dir):
+    path = os.path.join(run_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError: # removed meanwhile
+                pass
+    return total
+
+
+def prune_runs(runs_dir='runs', max_bytes=None, protect=()):
+    """
+    Evicts the least recently used run directories until runs_dir fits in
+    max_bytes and returns their paths. Use is the mtime of the manifest,
+    refreshed whenever a run is reused. Directories without a manifest (a
+    run still in progress) and the keys in protect are never removed.
+    """
+    if max_bytes is None or not os.path.isdir(runs_dir):
+        return []
+    entries = []
+    total = 0
+    for key in os.listdir(runs_dir):
+        run_dir = os.path.join(runs_dir, key)
+        if not os.path.isdir(run_dir):
+            continue
+        size = dir_size(run_dir)
+        total += size
+        manifest = os.path.join(run_dir, MANIFEST_NAME)
+        if key not in protect and os.path.exists(manifest):
+            entries.append((os.path.getmtime(manifest), size, run_dir))
+    evicted = []
+    for _, size, run_dir in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(run_dir, ignore_errors=True)
+        total -= size
+        evicted.append(run_dir)
+    if evicted:
+        print(f"Evicted {len(evicted)} least recently used runs; {runs_dir} now holds {total / 1e9:.2f} GB")
+    return evicted
+
+
+def run_ensemble(binary, jobs, runs_dir='runs', threads=None, workers=None, cores=None, reuse=True,
+                 budget_gb=BUDGET_GB):
+    """
+    Runs all jobs concurrently and returns their manifests in job order,
+    each with the run directory under 'run_dir'. A failed run is reported
+    in its manifest and does not stop the others. Jobs whose run directory
+    already holds a successful run are not started again (their manifest
+    gets 'reused': True) unless reuse=False, so an interrupted or partly
+    failed ensemble can simply be launched again. With a budget, the least
+    recently used runs of other ensembles are evicted afterwards.
+    """
+    code = code_key(binary)
+    binary_hash = content_hash(binary)
+    build = build_info(binary)
+    manifests = [None] * len(jobs)
+    # Planned for the whole ensemble, not only the pending jobs, so a relaunch keys its jobs the same way
+    n_workers, threads = plan_threads(len(jobs), threads, cores)
+    keys = [run_key(code, job, threads) for job in jobs]
+    pending = []
+    for i, key in enumerate(keys):
+        run_dir = os.path.join(os.path.abspath(runs_dir), key)
+        previous = read_manifest(run_dir) if reuse else None
+        if previous is not None and previous.get('status') == 'done':
+            os.utime(os.path.join(run_dir, MANIFEST_NAME)) # recently used
+            manifests[i] = dict(previous, run_dir=run_dir, reused=True)
+        else:
+            pending.append((i, key, run_dir))
+    if len(pending) < len(jobs):
+        print(f"Reusing {len(jobs) - len(pending)} finished runs")
+
+    if pending:
+        n_workers = min(n_workers, len(pending))
+        if workers is not None:
+            n_workers = max(1, min(workers, n_workers))
+        print(f"Running {len(pending)} jobs on {n_workers} workers x {threads} OpenMP threads")
+
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = {}
+            for i, key, run_dir in pending:
+                extra = {'binary_hash': binary_hash, 'code': code}
+                if build is not None:
+                    extra.update(build_key=build['key'], defines=build['defines'])
+                futures[pool.submit(run_job, binary, run_dir, jobs[i], threads, key, extra)] = (i, run_dir)
+            for future in as_completed(futures):
+                i, run_dir = futures[future]
+                try:
+                    manifest = future.result()
+                except Exception as e: # worker could not start the model at all
+                    manifest = {'label': jobs[i]['label'], 'status': 'failed', 'error': str(e)}
+                manifest['run_dir'] = run_dir
+                manifests[i] = manifest
+                print(f"  {manifest['label']}: {manifest['status']} "
+                      f"({manifest.get('wall_time_s', float('nan')):.1f} s, "
+                      f"{manifest.get('peak_rss_kb', 0) / 1024:.0f} MB) -> {run_dir}")
+
+    if budget_gb is not None:
+        prune_runs(runs_dir, budget_gb * 1e9, protect=set(keys))
+    return manifests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an ensemble of wcm.x in isolated run directories.")
+    parser.add_argument('--binary', default='output/wcm.x', help="Model executable (built by make)")
+    parser.add_argument('--namelist', default='parameters.nml', help="Namelist every replicate runs with")
+    parser.add_argument('--replicates', type=int, default=4, help="Number of replicates")
+    parser.add_argument('--threads', type=int, default=None, help="OpenMP threads per run (default: share the cores)")
+    parser.add_argument('--runs-dir', default='runs', help="Directory holding the run directories")
+    parser.add_argument('--rerun', action='store_true', help="Run again even where a finished run with the same inputs exists")
+    parser.add_argument('--budget-gb', type=float, default=BUDGET_GB,
+                        help="Evict least recently used runs beyond this size (default: $WCM_RUNS_BUDGET_GB, no limit)")
+    add_build_arguments(parser)
+    args = parser.parse_args()
+
+    with open(args.namelist) as f:
+        namelist = f.read()
+    jobs = [make_job(namelist, replicate) for replicate in range(args.replicates)]
+    manifests = run_ensemble(binary_from_arguments(args), jobs, args.runs_dir, args.threads,
+                             reuse=not args.rerun, budget_gb=args.budget_gb)
+    failed = [m['label'] for m in manifests if m['status'] != 'done']
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
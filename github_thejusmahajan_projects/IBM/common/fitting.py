@@ -0,0 +1,258 @@
+"""
+Batched least-squares fits used by the figure scripts.
+
+All fits are vectorized over a stack of independent problems (every
+snapshot of a run, or every run of a sweep): the normal equations of all
+problems are formed and solved together, and each problem carries its own
+damping factor and convergence flag.
+"""
+import numpy as np
+
+from traits import trait_axis
+
+
+def _log_moment_init(y, dx):
+    """
+    Closed-form Gaussian parameters from a weighted quadratic fit of log(y)
+    (weights y^2, Guo 2011), for every row of y. Rows where the fit does not
+    curve downwards fall back to the histogram moments.
+    """
+    positive = y > 0
+    w = np.where(positive, y * y, 0.0)
+    log_y = np.where(positive, np.log(np.where(positive, y, 1.0)), 0.0)
+    powers = np.stack([np.ones_like(dx), dx, dx**2], axis=1)
+
+    lhs = np.einsum('nb,bi,bj->nij', w, powers, powers)
+    rhs = np.einsum('nb,bi->ni', w * log_y, powers)
+    lhs += 1e-12 * np.eye(3) * lhs[:, :1, :1] # keep rows with fewer than 3 occupied bins solvable
+    a = np.linalg.solve(lhs, rhs[..., np.newaxis])[..., 0]
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        var = -0.5 / a[:, 2]
+        mean = a[:, 1] * var
+        amp = np.exp(a[:, 0] + mean**2 / (2 * var))
+
+        count = y.sum(axis=1)
+        m_mean = (y @ dx) / count
+        m_var = (y @ dx**2) / count - m_mean**2
+    bad = ~(var > 0) | ~np.isfinite(amp)
+    mean = np.where(bad, m_mean, mean)
+    var = np.where(bad, m_var, var)
+    amp = np.where(bad, y.max(axis=1), amp)
+    return amp, mean, np.sqrt(np.maximum(var, 1e-12))
+
+
+def _levenberg_marquardt(y, model, p, max_iter=50, tol=1e-8, positive=()):
+    """
+    Damped Gauss-Newton (Levenberg-Marquardt) for a stack of independent
+    problems. y is (n_rows, n_points) with NaN for missing points, p the
+    (n_rows, n_params) start values and model(p) returns the model values
+    (n_rows, n_points) and their analytic Jacobian (n_rows, n_points,
+    n_params). Only rows still iterating are evaluated; each row has its own
+    damping factor. Parameters listed in positive are kept positive.
+
+    Returns p, sse, converged, iterations and the standard errors from
+    s^2 (J^T J)^-1 at the solution.
+    """
+    w = ~np.isnan(y)
+    y = np.where(w, y, 0.0)
+    n_rows, n_params = p.shape
+    p = p.copy()
+    positive = list(positive)
+
+    complete = w.all()
+
+    def residual(rows, params):
+        f, J = model(params, rows)
+        if complete:
+            return y[rows] - f, J
+        return np.where(w[rows], y[rows] - f, 0.0), J * w[rows, :, np.newaxis]
+
+    start = np.flatnonzero(np.all(np.isfinite(p), axis=1))
+    sse = np.full(n_rows, np.nan)
+    sse[start] = np.sum(residual(start, p[start])[0]**2, axis=1)
+    lam = np.full(n_rows, 1e-3)
+    converged = np.zeros(n_rows, dtype=bool)
+    iterations = np.zeros(n_rows, dtype=np.int32)
+
+    active = start
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+        pa = p[active]
+        r, J = residual(active, pa)
+        jtj = np.swapaxes(J, 1, 2) @ J
+        jtr = (np.swapaxes(J, 1, 2) @ r[..., np.newaxis])[..., 0]
+
+        # Marquardt scaling of the diagonal; rows whose step does not reduce
+        # the residual keep their parameters and raise their damping.
+        diag = np.einsum('nii->ni', jtj)
+        diag = np.maximum(diag, 1e-12 * diag.max(axis=1, keepdims=True) + 1e-300)
+        damped = jtj + lam[active, np.newaxis, np.newaxis] * diag[:, :, np.newaxis] * np.eye(n_params)
+        step = np.linalg.solve(damped, jtr[..., np.newaxis])[..., 0]
+        trial = pa + step
+        trial[:, positive] = np.abs(trial[:, positive])
+        with np.errstate(invalid='ignore', over='ignore'):
+            trial_sse = np.sum(residual(active, trial)[0]**2, axis=1)
+
+        better = np.isfinite(trial_sse) & (trial_sse <= sse[active])
+        p[active[better]] = trial[better]
+        sse[active[better]] = trial_sse[better]
+        lam[active] = np.where(better, lam[active] * 0.3, lam[active] * 10.0)
+        iterations[active] += 1
+
+        small = np.all(np.abs(step) <= tol * (np.abs(pa) + tol), axis=1)
+        done = (better & small) | (lam[active] > 1e10)
+        converged[active[better & small]] = True
+        active = active[~done]
+
+    # Standard errors at the solution
+    se = np.full((n_rows, n_params), np.nan)
+    if start.size:
+        _, J = residual(start, p[start])
+        jtj = np.swapaxes(J, 1, 2) @ J
+        s2 = sse[start] / np.maximum(w[start].sum(axis=1) - n_params, 1)
+        with np.errstate(invalid='ignore'):
+            cov = s2[:, np.newaxis, np.newaxis] * np.linalg.pinv(jtj)
+            se[start] = np.sqrt(np.einsum('nii->ni', cov))
+    return p, sse, converged, iterations, se
+
+
+def fit_gaussians(dist_data, x_axis=None, max_iter=50, tol=1e-8):
+    """
+    Fits a * exp(-(x - x0)^2 / (2 sigma^2)) to every row of an
+    (n_steps, n_bins) histogram in one vectorized pass: log-moment
+    initialisation, then damped Gauss-Newton (Levenberg-Marquardt) steps
+    with the analytic Jacobian, applied to all rows still iterating.
+
+    Returns a dict of per-row arrays
+        amplitude, mean, sigma             fitted parameters
+        amplitude_se, mean_se, sigma_se    standard errors from s^2 (J^T J)^-1
+        sse                                residual sum of squares
+        converged                          relative step below tol
+        iterations                         Gauss-Newton iterations used
+    Empty rows give NaN parameters and converged=False.
+    """
+    y = np.asarray(dist_data, dtype=np.float64)
+    if y.ndim == 1:
+        y = y[np.newaxis, :]
+    n_rows, n_bins = y.shape
+    if x_axis is None:
+        x_axis = trait_axis(n_bins)
+    # Work about the axis centre, as trait_moments does, for better conditioning.
+    x0 = 0.5 * (x_axis[0] + x_axis[-1])
+    dx = np.asarray(x_axis, dtype=np.float64) - x0
+
+    valid = y.sum(axis=1) > 0
+    p = np.full((n_rows, 3), np.nan)
+    if np.any(valid):
+        p[valid] = np.column_stack(_log_moment_init(y[valid], dx))
+
+    def gaussian(params, rows):
+        z = (dx - params[:, 1:2]) / params[:, 2:3]
+        e = np.exp(-0.5 * z * z)
+        f = params[:, 0:1] * e
+        return f, np.stack([e, f * z / params[:, 2:3], f * z * z / params[:, 2:3]], axis=2)
+
+    p, sse, converged, iterations, se = _levenberg_marquardt(y, gaussian, p, max_iter, tol, positive=[2])
+    return {'amplitude': p[:, 0], 'mean': p[:, 1] + x0, 'sigma': p[:, 2],
+            'amplitude_se': se[:, 0], 'mean_se': se[:, 1], 'sigma_se': se[:, 2],
+            'sse': sse, 'converged': converged, 'iterations': iterations}
+
+
+def recovery_curve(time, t_initial, t_final, tau, t_jump):
+    """Adaptation curve of fit_recovery evaluated at time."""
+    elapsed = np.asarray(time) - t_jump
+    return np.where(elapsed > 0, t_final - (t_final - t_initial) * np.exp(-np.maximum(elapsed, 0.0) / tau), t_initial)
+
+
+def _recovery_init(time, y):
+    """
+    Start values [T_initial, T_final, tau, t_jump] for every row: plateau
+    medians from the first and last tenth of the series, the jump where the
+    series first leaves the initial plateau by 10% of the step, and tau from
+    the time taken to cover 63% of the step.
+    """
+    n_points = y.shape[1]
+    edge = max(n_points // 10, 1)
+    t_init = np.nanmedian(y[:, :edge], axis=1)
+    t_final = np.nanmedian(y[:, -edge:], axis=1)
+    step = t_final - t_init
+    with np.errstate(invalid='ignore'):
+        progress = (y - t_init[:, np.newaxis]) / step[:, np.newaxis]
+    progress = np.nan_to_num(progress, nan=0.0)
+
+    def first_time(level):
+        above = progress >= level
+        index = np.where(above.any(axis=1), np.argmax(above, axis=1), n_points - 1)
+        return time[index]
+
+    t_jump = first_time(0.1)
+    tau = np.maximum(first_time(0.63) - t_jump, time[1] - time[0])
+    return np.column_stack([t_init, t_final, tau, t_jump])
+
+
+def fit_recovery(time, series, t_jump=None, max_iter=100, tol=1e-8):
+    """
+    Fits the adaptation curve
+        T(t) = T_initial                                              t <= t_jump
+        T(t) = T_final - (T_final - T_initial) exp(-(t - t_jump) / tau)  t > t_jump
+    to every row of an (n_runs, n_steps) stack of mean-T_opt series sharing
+    one time axis, with T_initial, T_final, tau and t_jump all free.
+    NaN points (no agents) are ignored. t_jump, if given, is only the start
+    value of the jump time.
+
+    Returns a dict of per-run arrays
+        t_initial, t_final, tau, t_jump     fitted parameters (time in the units of time)
+        *_se                                their standard errors
+        sse, converged, iterations
+    """
+    time = np.asarray(time, dtype=np.float64)
+    y = np.asarray(series, dtype=np.float64)
+    if y.ndim == 1:
+        y = y[np.newaxis, :]
+
+    p = _recovery_init(time, y)
+    if t_jump is not None:
+        p[:, 3] = t_jump
+
+    def recovery(params, rows):
+        t_init, t_final, tau, jump = (params[:, k:k+1] for k in range(4))
+        elapsed = time - jump
+        after = elapsed > 0
+        e = np.where(after, np.exp(-np.where(after, elapsed, 0.0) / tau), 1.0)
+        drop = t_final - t_init
+        f = t_final - drop * e
+        zero = np.zeros_like(e)
+        J = np.stack([e,
+                      1.0 - e,
+                      np.where(after, -drop * e * elapsed / tau**2, zero),
+                      np.where(after, -drop * e / tau, zero)], axis=2)
+        return f, J
+
+    p, sse, converged, iterations, se = _levenberg_marquardt(y, recovery, p, max_iter, tol, positive=[2])
+    names = ['t_initial', 't_final', 'tau', 't_jump']
+    result = {name: p[:, k] for k, name in enumerate(names)}
+    result.update({f'{name}_se': se[:, k] for k, name in enumerate(names)})
+    result.update({'sse': sse, 'converged': converged, 'iterations': iterations})
+    return result
+
+
+RECOVERY_TABLE_COLUMNS = ['run', 'tau', 'tau_se', 't_initial', 't_initial_se', 't_final', 't_final_se',
+                          't_jump', 't_jump_se', 'sse', 'converged', 'iterations']
+
+
+def save_recovery_table(fits, filename, runs=None):
+    """Writes fit_recovery results as CSV, one row per run (runs: labels, default the row index)."""
+    import csv
+    n_runs = len(fits['tau'])
+    runs = list(range(n_runs)) if runs is None else list(runs)
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RECOVERY_TABLE_COLUMNS)
+        for k in range(n_runs):
+            row = [runs[k]]
+            for column in RECOVERY_TABLE_COLUMNS[1:]:
+                value = fits[column][k]
+                row.append(int(value) if column in ('converged', 'iterations') else f'{value:.6g}')
+            writer.writerow(row)
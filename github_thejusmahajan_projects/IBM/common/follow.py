@@ -0,0 +1,229 @@
+"""
+Live monitor for a running wcm.x.
+
+Follows the growing fort.10/11/12 files of an output directory and consumes
+only the complete records appended since the previous poll; a partially
+flushed trailing record is left for the next poll. Running statistics
+(mean T_opt, agent count, biomass, seasonal lag) are updated from the new
+records only, and a small status plot is refreshed every N simulated days.
+
+Usage (from a study directory, while `make run` is in progress):
+    python3 ../../common/follow.py output --every 30 --nyears 10
+"""
+import argparse
+import os
+import time as walltime
+import numpy as np
+
+from fortio import MARKER, record_dtype
+from namelist import run_parameters
+from traits import trait_moments
+
+DAYS_PER_YEAR = 360
+
+
+class RecordTail:
+    """Incremental reader of the complete records appended to one fort.<unit> file."""
+
+    def __init__(self, filename, unit):
+        self.filename = filename
+        self.unit = unit
+        self.dtype = None
+        self.n_read = 0
+
+    def poll(self):
+        """Structured array of the records completed since the last poll (possibly empty)."""
+        if not os.path.exists(self.filename):
+            return None
+        with open(self.filename, 'rb') as f:
+            if self.dtype is None:
+                head = f.read(MARKER.itemsize)
+                if len(head) < MARKER.itemsize:
+                    return None
+                self.dtype = record_dtype(self.unit, int(np.frombuffer(head, dtype=MARKER)[0]))
+            n_complete = os.fstat(f.fileno()).st_size // self.dtype.itemsize
+            if n_complete <= self.n_read:
+                return np.zeros(0, dtype=self.dtype)
+            f.seek(self.n_read * self.dtype.itemsize)
+            block = np.frombuffer(f.read((n_complete - self.n_read) * self.dtype.itemsize), dtype=self.dtype)
+
+        payload = self.dtype.itemsize - 2 * MARKER.itemsize
+        bad = np.flatnonzero((block['head'] != payload) | (block['tail'] != payload))
+        if bad.size:
+            if bad[0] == 0:
+                raise ValueError(f"{self.filename}: corrupt record markers at record {self.n_read}")
+            block = block[:bad[0]]
+        self.n_read += block.shape[0]
+        return block
+
+
+class LiveStats:
+    """
+    Running statistics of a run, fed with newly completed records only.
+    Per-record series are kept as 1-D arrays (a few floats per simulated
+    day) in buffers that double when full, so a poll costs the new records
+    only; the trait histograms themselves are not retained.
+    """
+    KEYS = ('temp', 'phyt', 'count', 'mean_topt')
+
+    def __init__(self, output_dt=86400.0, capacity=1024):
+        self.step_days = output_dt / 86400.0
+        self._buffers = {key: np.empty(capacity) for key in self.KEYS}
+        self._lengths = {key: 0 for key in self.KEYS}
+        self.n = 0
+        self.year_lags = []
+
+    @property
+    def series(self):
+        """The filled part of each buffer (views, valid until the next add)."""
+        return {key: self._buffers[key][:self._lengths[key]] for key in self.KEYS}
+
+    def _append(self, key, values):
+        length = self._lengths[key]
+        buffer = self._buffers[key]
+        if length + len(values) > buffer.size:
+            grown = np.empty(max(2 * buffer.size, length + len(values)))
+            grown[:length] = buffer[:length]
+            self._buffers[key] = buffer = grown
+        buffer[length:length + len(values)] = values
+        self._lengths[key] = length + len(values)
+
+    def add(self, fort10=None, fort11=None, fort12=None):
+        """Appends new records; only steps present in all three files are processed."""
+        if fort10 is not None and fort10.shape[0]:
+            self._append('temp', fort10['data'][:, 0])
+        if fort11 is not None and fort11.shape[0]:
+            self._append('phyt', fort11['data'][:, 2])
+        if fort12 is not None and fort12.shape[0]:
+            stats = trait_moments(fort12['nbr_cls'], fractions=False)
+            self._append('count', stats['count'])
+            self._append('mean_topt', stats['mean'])
+
+        n_before = self.n
+        self.n = min(self._lengths.values())
+        self._update_lag(n_before)
+        return self.n - n_before
+
+    def _update_lag(self, n_before):
+        # Record 0 is the initial state; year k covers records 1 + k*360 ... (k+1)*360.
+        # The lag of each newly completed year is the offset of the annual maxima.
+        year_len = int(round(DAYS_PER_YEAR / self.step_days))
+        first = max(0, (n_before - 1) // year_len)
+        for k in range(first, (self.n - 1) // year_len):
+            if k < len(self.year_lags):
+                continue
+            window = slice(1 + k * year_len, 1 + (k + 1) * year_len)
+            env = self._buffers['temp'][window]
+            trait = self._buffers['mean_topt'][window]
+            if np.all(np.isnan(trait)):
+                self.year_lags.append(np.nan)
+                continue
+            offset = (np.nanargmax(trait) - np.argmax(env)) % year_len
+            if offset >= year_len / 2:
+                offset -= year_len
+            self.year_lags.append(offset * self.step_days)
+
+    @property
+    def days(self):
+        return (self.n - 1) * self.step_days if self.n else 0.0
+
+    def summary(self):
+        if self.n == 0:
+            return "waiting for output..."
+        i = self.n - 1
+        lags = [lag for lag in self.year_lags[1:] if not np.isnan(lag)]
+        lag = f"{np.mean(lags):.1f} d" if lags else "n/a"
+        series = self._buffers
+        return (f"Day {self.days:8.1f} | Temp {series['temp'][i]:7.3f} | "
+                f"Mean T_opt {series['mean_topt'][i]:7.3f} | Agents {int(series['count'][i]):7d} | "
+                f"Phyt {series['phyt'][i]:7.4f} | Lag {lag}")
+
+
+class StatusPlot:
+    """One figure whose lines are updated in place and re-saved on every refresh."""
+
+    def __init__(self, filename):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        self.filename = filename
+        self.fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(8, 8), sharex=True)
+        self.lines = {
+            'temp': ax1.plot([], [], 'k-', linewidth=1.0, label='Env Temp')[0],
+            'mean_topt': ax1.plot([], [], 'b--', linewidth=1.5, label='Mean $T_{opt}$')[0],
+            'count': ax2.plot([], [], 'r-', linewidth=1.0)[0],
+            'phyt': ax3.plot([], [], 'g-', linewidth=1.0)[0],
+        }
+        ax1.set_ylabel('Temperature [°C]')
+        ax1.legend(loc='lower right')
+        ax2.set_ylabel('Agents')
+        ax3.set_ylabel('Phytoplankton [mmol N m$^{-3}$]')
+        ax3.set_xlabel('Time [Years]')
+        self.axes = (ax1, ax2, ax3)
+        self.title = ax1.set_title('')
+
+    def refresh(self, stats):
+        time = np.arange(stats.n) * stats.step_days / DAYS_PER_YEAR
+        for key, line in self.lines.items():
+            line.set_data(time, stats.series[key][:stats.n])
+        for ax in self.axes:
+            ax.relim()
+            ax.autoscale_view()
+        self.title.set_text(f'Live Status: Year {stats.days / DAYS_PER_YEAR:.2f}')
+        self.fig.savefig(self.filename, dpi=100)
+
+
+def follow(output_dir, every_days=30, poll_seconds=5.0, nyears=None, idle_timeout=600.0,
+           plot_file=None, output_dt=86400.0):
+    """
+    Polls output_dir until nyears are complete or no new record has arrived
+    for idle_timeout seconds. Returns the LiveStats of the run.
+    """
+    tails = {unit: RecordTail(os.path.join(output_dir, f'fort.{unit}'), unit) for unit in (10, 11, 12)}
+    stats = LiveStats(output_dt)
+    plot = StatusPlot(plot_file) if plot_file else None
+    expected = nyears * int(round(DAYS_PER_YEAR * 86400.0 / output_dt)) + 1 if nyears else None
+    next_plot = 0.0
+    last_change = walltime.time()
+
+    while True:
+        blocks = {unit: tail.poll() for unit, tail in tails.items()}
+        if stats.add(blocks[10], blocks[11], blocks[12]):
+            last_change = walltime.time()
+            print(stats.summary(), flush=True)
+            if plot is not None and stats.days >= next_plot:
+                plot.refresh(stats)
+                next_plot = (stats.days // every_days + 1) * every_days
+        if expected is not None and stats.n >= expected:
+            break
+        if walltime.time() - last_change > idle_timeout:
+            print(f"No new output for {idle_timeout:.0f} s, stopping.")
+            break
+        walltime.sleep(poll_seconds)
+
+    if plot is not None and stats.n:
+        plot.refresh(stats)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow the fort.* output of a running wcm.x.")
+    parser.add_argument('output_dir', nargs='?', default='output', help="Directory the model writes fort.* to")
+    parser.add_argument('--every', type=float, default=30.0, help="Refresh the status plot every N simulated days")
+    parser.add_argument('--poll', type=float, default=5.0, help="Seconds between polls")
+    parser.add_argument('--nyears', type=int, default=None,
+                        help="Stop once this many simulated years are complete (default: nyears of the run's namelist)")
+    parser.add_argument('--idle-timeout', type=float, default=600.0, help="Stop after this many seconds without new output")
+    parser.add_argument('--plot', default='plots/live_status.png', help="Status plot file ('' to disable)")
+    args = parser.parse_args()
+
+    if args.nyears is None:
+        args.nyears = run_parameters([os.path.join(args.output_dir, 'parameters.nml'), 'parameters.nml'],
+                                     {'nyears': None})['nyears']
+    if args.plot:
+        os.makedirs(os.path.dirname(args.plot) or '.', exist_ok=True)
+    follow(args.output_dir, args.every, args.poll, args.nyears, args.idle_timeout, args.plot or None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Zero-copy readers for the unformatted Fortran output of wcm.x.
+
+Every WRITE(n) in wcm.F90 produces one sequential record framed by a 4-byte
+length marker before and after the payload. Because all records of a unit
+have the same size, a whole file can be mapped with np.memmap through a
+structured dtype and the columns handed out as strided views: no per-record
+Python work and no copy. The read_fort* functions additionally go through
+the persistent columnar store of runcache.py, which maps the same columns
+from contiguous marker-free .npy files.
+
+Record layouts (gfortran, little-endian, Ms = 200):
+    fort.10: temp, swrad                       2 x float64
+    fort.11: aorg, detr, phyt                  3 x float64
+    fort.12: nbr_cls(0:Ms), growthmean0, growthmean
+                                               (Ms+1) x int32 + 2 x float64
+    fort.13: MINVAL(igen), MAXVAL(igen)        2 x int32
+    fort.14: strain(0:Ms), growthmean0         (Ms+1) x float64 + float64
+"""
+import os
+import numpy as np
+
+MARKER = np.dtype('<i4')
+
+
+def record_dtype(unit, payload_bytes=None):
+    """
+    Structured dtype of one framed record of fort.<unit>.
+    For fort.12 and fort.14 the number of trait bins is derived from the
+    payload size, so runs compiled with a different Ms are read correctly.
+    """
+    if unit == 10:
+        fields = [('data', '<f8', (2,))]
+    elif unit == 11:
+        fields = [('data', '<f8', (3,))]
+    elif unit == 12:
+        if payload_bytes is None:
+            payload_bytes = 201 * 4 + 2 * 8
+        n_bins = (payload_bytes - 2 * 8) // 4
+        fields = [('nbr_cls', '<i4', (n_bins,)),
+                  ('growthmean0', '<f8'),
+                  ('growthmean', '<f8')]
+    elif unit == 13:
+        fields = [('data', '<i4', (2,))]
+    elif unit == 14:
+        if payload_bytes is None:
+            payload_bytes = 201 * 8 + 8
+        n_bins = (payload_bytes - 8) // 8
+        fields = [('strain', '<f8', (n_bins,)),
+                  ('growthmean0', '<f8')]
+    else:
+        raise ValueError(f"No record layout known for fort.{unit}")
+    return np.dtype([('head', MARKER)] + fields + [('tail', MARKER)])
+
+
+def memmap_fort(filename, unit):
+    """
+    Maps fort.<unit> as a read-only structured array of framed records.
+    A trailing partial record (file still being written) is ignored.
+    Returns None if the file does not exist.
+    """
+    if not os.path.exists(filename):
+        print(f"File {filename} not found.")
+        return None
+
+    file_size = os.path.getsize(filename)
+    if file_size < MARKER.itemsize:
+        return np.zeros(0, dtype=record_dtype(unit))
+
+    payload = int(np.fromfile(filename, dtype=MARKER, count=1)[0])
+    dtype = record_dtype(unit, payload)
+    if dtype.itemsize != payload + 2 * MARKER.itemsize:
+        raise ValueError(f"{filename}: record marker {payload} does not match fort.{unit} layout")
+
+    n_records = file_size // dtype.itemsize
+    if n_records == 0:
+        return np.zeros(0, dtype=dtype)
+
+    records = np.memmap(filename, dtype=dtype, mode='r', shape=(n_records,))
+
+    # Markers are checked on the first and last record only, which catches
+    # a wrong unit or a truncated file without touching every page.
+    for rec in (records[0], records[-1]):
+        if rec['head'] != payload or rec['tail'] != payload:
+            raise ValueError(f"{filename}: corrupt record markers")
+    return records
+
+
+class RecordFile:
+    """
+    Direct-seek access to the fixed-size records of one fort.<unit> file.
+    Only the bytes of the requested records are read, so picking a snapshot
+    or the final state costs the same for a 1-year and a 100-year run.
+    Records are addressed by index, by simulated day or by simulated year;
+    record 0 is the initial state written before the time loop.
+    """
+
+    def __init__(self, filename, unit, output_dt=86400.0, days_per_year=360):
+        self.filename = filename
+        self.unit = unit
+        self.output_dt = output_dt
+        self.days_per_year = days_per_year
+        self._fh = open(filename, 'rb')
+        head = self._fh.read(MARKER.itemsize)
+        payload = int(np.frombuffer(head, dtype=MARKER)[0]) if len(head) == MARKER.itemsize else None
+        self.dtype = record_dtype(unit, payload)
+
+    def close(self):
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        # Re-read the size on every call so a file that is still growing is handled.
+        return os.fstat(self._fh.fileno()).st_size // self.dtype.itemsize
+
+    def _normalize(self, i):
+        n = len(self)
+        j = i + n if i < 0 else i
+        if not 0 <= j < n:
+            raise IndexError(f"record {i} out of range for {self.filename} ({n} records)")
+        return j
+
+    def record(self, i):
+        """Record i (negative indices count from the end) as a structured scalar."""
+        self._fh.seek(self._normalize(i) * self.dtype.itemsize)
+        rec = np.frombuffer(self._fh.read(self.dtype.itemsize), dtype=self.dtype)[0]
+        payload = self.dtype.itemsize - 2 * MARKER.itemsize
+        if rec['head'] != payload or rec['tail'] != payload:
+            raise ValueError(f"{self.filename}: corrupt record markers at record {i}")
+        return rec
+
+    def records(self, indices):
+        """Records at the given indices, in the given order, as a structured array."""
+        out = np.empty(len(indices), dtype=self.dtype)
+        for k, i in enumerate(indices):
+            out[k] = self.record(i)
+        return out
+
+    def last(self):
+        return self.record(-1)
+
+    def index(self, day=None, year=None):
+        """Record index of a simulated day or year."""
+        if year is not None:
+            day = year * self.days_per_year
+        return int(round(day * 86400.0 / self.output_dt))
+
+    def day(self, day):
+        return self.record(self.index(day=day))
+
+    def year(self, year):
+        return self.record(self.index(year=year))
+
+
+def _from_cache(filename, columns):
+    # Imported here because runcache itself reads through memmap_fort.
+    from runcache import cached_columns
+    return cached_columns(filename, columns)
+
+
+def read_fort10(filename, use_cache=True):
+    """
+    Temperature and irradiance from fort.10 as an (n_steps, 2) array,
+    served from the run cache when possible, else as a view of the file.
+    """
+    if use_cache:
+        cached = _from_cache(filename, ['temp_swrad'])
+        if cached is not None:
+            return cached[0]
+    records = memmap_fort(filename, 10)
+    if records is None:
+        return None
+    return records['data']
+
+
+def read_fort11(filename, use_cache=True):
+    """Nutrients, detritus and phytoplankton from fort.11 as an (n_steps, 3) array."""
+    if use_cache:
+        cached = _from_cache(filename, ['aorg_detr_phyt'])
+        if cached is not None:
+            return cached[0]
+    records = memmap_fort(filename, 11)
+    if records is None:
+        return None
+    return records['data']
+
+
+def read_fort12(filename, use_cache=True):
+    """Trait histogram nbr_cls from fort.12 as an (n_steps, Ms+1) int32 array."""
+    if use_cache:
+        cached = _from_cache(filename, ['nbr_cls'])
+        if cached is not None:
+            return cached[0]
+    records = memmap_fort(filename, 12)
+    if records is None:
+        return None
+    return records['nbr_cls']
+
+
+def read_fort12_growth(filename, use_cache=True):
+    """growthmean0 and growthmean from fort.12 as two (n_steps,) arrays."""
+    if use_cache:
+        cached = _from_cache(filename, ['growthmean0', 'growthmean'])
+        if cached is not None:
+            return tuple(cached)
+    records = memmap_fort(filename, 12)
+    if records is None:
+        return None, None
+    return records['growthmean0'], records['growthmean']
+
+
+def read_fort13(filename):
+    """
+    Minimum and maximum generation of the living agents from fort.13 as an
+    (n_steps, 2) int32 view. When no agent is alive gfortran writes
+    +/-HUGE for MINVAL/MAXVAL; generations.generation_range masks these.
+    """
+    records = memmap_fort(filename, 13)
+    if records is None:
+        return None
+    return records['data']
+
+
+def read_fort14(filename):
+    """Eulerian strain(0:Ms) biomass from fort.14 as an (n_steps, Ms+1) float64 view."""
+    records = memmap_fort(filename, 14)
+    if records is None:
+        return None
+    return records['strain']
+
+
+def iter_records(filename, unit, block_size=4096):
+    """
+    Yields consecutive blocks of at most block_size records of fort.<unit>
+    as private structured arrays, so peak memory is bounded by the block
+    size and not by the length of the run.
+    """
+    records = memmap_fort(filename, unit)
+    if records is None:
+        return
+    for start in range(0, records.shape[0], block_size):
+        yield np.array(records[start:start + block_size])
+
+
+def iter_fort12(filename, block_size=4096):
+    """
+    Yields (nbr_cls, growthmean0, growthmean) for consecutive blocks of at
+    most block_size records of fort.12. Always reads the binary directly,
+    never the run cache.
+    """
+    for block in iter_records(filename, 12, block_size):
+        yield block['nbr_cls'], block['growthmean0'], block['growthmean']
@@ -0,0 +1,52 @@
+"""
+Generation turnover of the agent population from fort.13, which holds
+MINVAL(igen) and MAXVAL(igen) over the living agents for every output step.
+"""
+import numpy as np
+
+# gfortran returns +HUGE / -HUGE-1 for MINVAL / MAXVAL over an empty mask.
+INT_HUGE = 2**31 - 1
+
+
+def generation_range(gen13):
+    """Minimum and maximum generation as float arrays, NaN where no agent was alive."""
+    gen_min = gen13[:, 0].astype(np.float64)
+    gen_max = gen13[:, 1].astype(np.float64)
+    gen_min[gen13[:, 0] >= INT_HUGE] = np.nan
+    gen_max[gen13[:, 1] <= -INT_HUGE] = np.nan
+    return gen_min, gen_max
+
+
+def generation_turnover(gen13, output_dt=86400.0):
+    """
+    Vectorized turnover statistics of an (n_steps, 2) fort.13 array.
+
+    Returns a dict with
+        time      output time [days]
+        gen_min, gen_max, spread
+                  generation range of the living agents and its width
+        rate_max, rate_min
+                  generations per day gained by the youngest and oldest
+                  surviving lineage between consecutive outputs (NaN first)
+        rate      least-squares slope of gen_max over the whole run [generations/day]
+    """
+    step_days = output_dt / 86400.0
+    n_steps = gen13.shape[0]
+    time = np.arange(n_steps) * step_days
+    gen_min, gen_max = generation_range(gen13)
+
+    rate_max = np.full(n_steps, np.nan)
+    rate_min = np.full(n_steps, np.nan)
+    rate_max[1:] = np.diff(gen_max) / step_days
+    rate_min[1:] = np.diff(gen_min) / step_days
+
+    valid = ~np.isnan(gen_max)
+    if np.count_nonzero(valid) >= 2:
+        t = time[valid] - time[valid].mean()
+        rate = np.dot(t, gen_max[valid] - gen_max[valid].mean()) / np.dot(t, t)
+    else:
+        rate = np.nan
+
+    return {'time': time, 'gen_min': gen_min, 'gen_max': gen_max,
+            'spread': gen_max - gen_min,
+            'rate_max': rate_max, 'rate_min': rate_min, 'rate': rate}
@@ -0,0 +1,71 @@
+"""
+Hovmoller diagrams of the trait density at the resolution of the output
+raster.
+
+A pcolormesh over an (n_bins, n_steps) matrix draws one quad per bin and
+output step, about 7 million for a 100-year daily run, although the saved
+figure has only a few thousand pixel columns. plot_hovmoller first reduces
+the time axis to those columns (mean or max over the steps falling into
+each), then draws the reduced matrix with imshow (bilinear interpolation
+between bins, as the gouraud shading did) and takes the contours from the
+same reduced grid. The cost then follows the figure size instead of the run
+length. The reduction reads the matrix a block of columns at a time, so it
+may be a view of a memory-mapped fort.12.
+"""
+import numpy as np
+
+REDUCTIONS = {'mean': np.add, 'max': np.maximum}
+
+
+def raster_columns(ax, dpi):
+    """Pixel columns of ax when its figure is saved at dpi."""
+    fig = ax.figure
+    return max(int(np.ceil(ax.get_position().width * fig.get_figwidth() * dpi)), 1)
+
+
+def reduce_columns(matrix, n_columns, reduce='mean', block_steps=8192):
+    """
+    Reduces the columns (time steps) of matrix (n_bins, n_steps) to at most
+    n_columns of nearly equal width. Returns the reduced float64 matrix and
+    the step index edges (n_columns + 1) of its columns; a matrix that is
+    already narrow enough is returned as it is.
+    """
+    if reduce not in REDUCTIONS:
+        raise ValueError(f"Unknown reduction {reduce}; use one of {', '.join(REDUCTIONS)}")
+    n_steps = matrix.shape[1]
+    if n_steps <= n_columns:
+        return np.asarray(matrix, dtype=np.float64), np.arange(n_steps + 1)
+    edges = np.unique(np.linspace(0, n_steps, n_columns + 1).round().astype(int))
+    reduced = np.empty((matrix.shape[0], edges.size - 1))
+    first = 0
+    while first < edges.size - 1:
+        # Columns whose steps fit into one block, at least one column
+        last = max(np.searchsorted(edges, edges[first] + block_steps, side='right') - 1, first + 1)
+        block = np.asarray(matrix[:, edges[first]:edges[last]], dtype=np.float64)
+        reduced[:, first:last] = REDUCTIONS[reduce].reduceat(block, edges[first:last] - edges[first], axis=1)
+        first = last
+    if reduce == 'mean':
+        reduced /= np.diff(edges)
+    return reduced, edges
+
+
+def plot_hovmoller(ax, matrix, time, y_bins, dpi, reduce='mean', norm=None, cmap='YlOrRd', levels=None,
+                   contour_kw=None):
+    """
+    Draws matrix (n_bins, n_steps), sampled at the equally spaced times and
+    at y_bins, into ax at the pixel resolution of a figure saved at dpi.
+    levels (a sequence of values or, as for ax.contour, a count), if given,
+    are contoured on the reduced grid (contour_kw are passed to
+    ax.contour). Returns the image, e.g. for a colorbar.
+    """
+    reduced, edges = reduce_columns(matrix, raster_columns(ax, dpi), reduce)
+    step = time[1] - time[0] if len(time) > 1 else 1.0
+    dy = y_bins[1] - y_bins[0]
+    # Column j covers the steps edges[j]..edges[j+1]-1, each a cell centred on its time
+    column_edges = time[0] + (edges - 0.5) * step
+    image = ax.imshow(reduced, origin='lower', aspect='auto', interpolation='bilinear', cmap=cmap, norm=norm,
+                      extent=(column_edges[0], column_edges[-1], y_bins[0] - 0.5 * dy, y_bins[-1] + 0.5 * dy))
+    if levels is not None and np.size(levels): # an empty list (no level below the maximum) draws none
+        centres = 0.5 * (column_edges[:-1] + column_edges[1:])
+        ax.contour(centres, y_bins, reduced, levels=levels, **(contour_kw or {}))
+    return image
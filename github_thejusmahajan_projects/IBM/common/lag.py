@@ -0,0 +1,244 @@
+"""
+Seasonal lag and amplitude ratio between environmental temperature and the
+mean trait (Benchmark B of Beckmann et al. 2019).
+
+Two estimators are provided, both vectorized over ensemble members:
+  - a least-squares harmonic fit a + b cos(wt) + c sin(wt) at the annual
+    frequency, giving amplitude, phase and their standard errors; the lag is
+    the phase difference of trait and environment;
+  - an FFT cross-correlation whose peak, searched within half a period and
+    normalized by the overlap length, gives an independent lag estimate.
+rolling_seasonal_lag repeats the harmonic fit in a window slid year by year,
+updating the fit incrementally, and returns a per-year table (see
+save_lag_table) for long runs such as the warming hindcasts.
+Series may contain NaN (timesteps without agents); these are given zero
+weight in the fit and zero value in the correlation.
+"""
+import numpy as np
+
+DAYS_PER_YEAR = 360.0
+Z95 = 1.959963984540054
+
+
+def _as_members(series):
+    return np.atleast_2d(np.asarray(series, dtype=np.float64))
+
+
+def _design(n_steps, step_days, period_days, offset=0):
+    omega = 2.0 * np.pi / period_days
+    t = (offset + np.arange(n_steps)) * step_days
+    return np.stack([np.ones(n_steps), np.cos(omega * t), np.sin(omega * t)], axis=-1)
+
+
+def _normal_sums(y, X):
+    """
+    Sufficient statistics of the weighted harmonic fit for blocks of a
+    series: y is (n_members, n_blocks, block_len), X is (n_blocks, block_len, 3).
+    Sums are additive over blocks, so the fit of any run of consecutive
+    blocks follows from adding and subtracting block sums. Lag-1 products
+    are taken within a block.
+    """
+    w = (~np.isnan(y)).astype(np.float64)
+    yw = np.where(w > 0, y, 0.0)
+    ww = w[..., 1:] * w[..., :-1]
+    return {
+        'n': w.sum(axis=-1),
+        'xtwx': np.einsum('mbt,bti,btj->mbij', w, X, X, optimize=True),
+        'xtwy': np.einsum('mbt,bti->mbi', yw, X),
+        'yty': np.sum(yw * yw, axis=-1),
+        'yy1': np.sum(yw[..., 1:] * yw[..., :-1], axis=-1),
+        'yx1': (np.einsum('mbt,bti->mbi', yw[..., 1:] * w[..., :-1], X[:, :-1])
+                + np.einsum('mbt,bti->mbi', yw[..., :-1] * w[..., 1:], X[:, 1:])),
+        'xx1': np.einsum('mbt,bti,btj->mbij', ww, X[:, 1:], X[:, :-1], optimize=True),
+    }
+
+
+def _fit_from_sums(sums):
+    """Harmonic fit and standard errors from (possibly accumulated) _normal_sums."""
+    xtwx = sums['xtwx']
+    beta = np.linalg.solve(xtwx, sums['xtwy'][..., np.newaxis])[..., 0]
+
+    # Residual sum of squares and lag-1 residual products, expanded in the sums
+    n = sums['n']
+    r0 = (sums['yty'] - 2 * np.einsum('...i,...i', beta, sums['xtwy'])
+          + np.einsum('...i,...ij,...j', beta, xtwx, beta))
+    r1 = (sums['yy1'] - np.einsum('...i,...i', beta, sums['yx1'])
+          + np.einsum('...i,...ij,...j', beta, sums['xx1'], beta))
+    r0 = np.maximum(r0, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rho = np.clip(r1 / r0, 0.0, 0.99)
+        n_eff = n * (1.0 - rho) / (1.0 + rho)
+        s2 = r0 / np.maximum(n - 3.0, 1.0) * (n / np.maximum(n_eff, 4.0))
+    cov = s2[..., np.newaxis, np.newaxis] * np.linalg.inv(xtwx)
+
+    b, c = beta[..., 1], beta[..., 2]
+    amp = np.hypot(b, c)
+    vbb, vcc, vbc = cov[..., 1, 1], cov[..., 2, 2], cov[..., 1, 2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        amp_se = np.sqrt((b**2 * vbb + 2 * b * c * vbc + c**2 * vcc)) / amp
+        phase_se = np.sqrt((c**2 * vbb - 2 * b * c * vbc + b**2 * vcc)) / amp**2
+    return {'mean': beta[..., 0], 'amplitude': amp, 'phase': np.arctan2(c, b),
+            'amplitude_se': amp_se, 'phase_se': phase_se}
+
+
+def _centered(y):
+    # Removing the series mean first keeps the expanded residual sums accurate.
+    valid = ~np.isnan(y)
+    mean = np.nansum(y, axis=-1, keepdims=True) / np.maximum(valid.sum(axis=-1, keepdims=True), 1)
+    return y - mean, mean[..., 0]
+
+
+def harmonic_fit(series, step_days=1.0, period_days=DAYS_PER_YEAR):
+    """
+    Fits a + b cos(wt) + c sin(wt) to every row of an (n_members, n_steps)
+    array (or a single series). Returns a dict of per-member arrays:
+    mean, amplitude, phase [rad], amplitude_se, phase_se.
+    Standard errors use the residual variance inflated for lag-1
+    autocorrelation of the residuals (effective sample size).
+    """
+    y, mean = _centered(_as_members(series))
+    X = _design(y.shape[1], step_days, period_days)
+    sums = _normal_sums(y[:, np.newaxis, :], X[np.newaxis])
+    fit = {key: value[:, 0] for key, value in _fit_from_sums(sums).items()}
+    fit['mean'] = fit['mean'] + mean
+    return fit
+
+
+def _compare(fit_env, fit_trait, period_days):
+    """Lag and amplitude ratio with 95% intervals from two harmonic fits."""
+    omega = 2.0 * np.pi / period_days
+    dphase = np.angle(np.exp(1j * (fit_trait['phase'] - fit_env['phase'])))
+    lag = dphase / omega
+    lag_se = np.hypot(fit_env['phase_se'], fit_trait['phase_se']) / omega
+
+    ratio = fit_trait['amplitude'] / fit_env['amplitude']
+    ratio_se = ratio * np.hypot(fit_trait['amplitude_se'] / fit_trait['amplitude'],
+                                fit_env['amplitude_se'] / fit_env['amplitude'])
+    return {
+        'lag_days': lag,
+        'lag_ci': np.stack([lag - Z95 * lag_se, lag + Z95 * lag_se], axis=-1),
+        'amp_env': np.broadcast_to(fit_env['amplitude'], ratio.shape),
+        'amp_trait': fit_trait['amplitude'],
+        'amp_ratio': ratio,
+        'amp_ratio_ci': np.stack([ratio - Z95 * ratio_se, ratio + Z95 * ratio_se], axis=-1),
+    }
+
+
+def xcorr_lag(env, trait, step_days=1.0, max_lag_days=DAYS_PER_YEAR / 2):
+    """
+    Lag in days at the peak of the FFT cross-correlation of each member,
+    positive when the trait lags the environment. The correlation at each
+    shift is divided by the number of overlapping samples, and only shifts
+    within +/- max_lag_days are considered.
+    """
+    env = _as_members(env)
+    trait = _as_members(trait)
+    n_steps = trait.shape[1]
+    env, trait = np.broadcast_arrays(env, trait)
+
+    def prepared(y):
+        valid = ~np.isnan(y)
+        mean = np.nansum(y, axis=1, keepdims=True) / np.maximum(valid.sum(axis=1, keepdims=True), 1)
+        return np.where(valid, y - mean, 0.0)
+
+    n_fft = 1 << int(np.ceil(np.log2(2 * n_steps - 1)))
+    spectrum = np.conj(np.fft.rfft(prepared(env), n_fft)) * np.fft.rfft(prepared(trait), n_fft)
+    corr = np.fft.irfft(spectrum, n_fft)
+
+    max_shift = min(int(max_lag_days / step_days), n_steps - 1)
+    shifts = np.arange(-max_shift, max_shift + 1)
+    window = corr[:, shifts % n_fft] / (n_steps - np.abs(shifts))
+    return shifts[np.argmax(window, axis=1)] * step_days
+
+
+def seasonal_lag(env, trait, step_days=1.0, period_days=DAYS_PER_YEAR):
+    """
+    Lag [days] and amplitude ratio of trait vs environment with 95%
+    confidence intervals, for one series or an (n_members, n_steps) stack.
+    env may be shared by all members (1-D) or given per member.
+
+    Returns a dict of per-member arrays (scalars for 1-D input):
+        lag_days, lag_ci (lower, upper), amp_env, amp_trait,
+        amp_ratio, amp_ratio_ci (lower, upper), xcorr_lag_days
+    """
+    scalar = np.ndim(trait) == 1 and np.ndim(env) == 1
+    fit_env = harmonic_fit(env, step_days, period_days)
+    fit_trait = harmonic_fit(trait, step_days, period_days)
+
+    result = _compare(fit_env, fit_trait, period_days)
+    result['xcorr_lag_days'] = xcorr_lag(env, trait, step_days, period_days / 2)
+    if scalar:
+        result = {key: value[0] for key, value in result.items()}
+    return result
+
+
+def rolling_seasonal_lag(env, trait, step_days=1.0, window_years=1, period_days=DAYS_PER_YEAR, offset=1):
+    """
+    Lag and amplitude ratio in a window of window_years whole years, slid one
+    year at a time over the run. The normal equations of the harmonic fit
+    are summed once per year; each window then follows from the previous one
+    by adding the entering and subtracting the leaving year, so the cost per
+    window does not depend on its length. The first offset records (record 0
+    is the initial state) are skipped; a trailing partial year is dropped.
+
+    Returns a per-window table as a dict of arrays (one row per window, with
+    a leading member axis for 2-D trait input):
+        year_start, year_end      window [year_start, year_end) in simulated years
+        lag_days, lag_ci, amp_env, amp_trait, amp_ratio, amp_ratio_ci
+        mean_env, mean_trait      window means of the fitted harmonic
+    """
+    scalar = np.ndim(trait) == 1 and np.ndim(env) == 1
+    year_len = int(round(period_days / step_days))
+    n_steps = min(np.shape(env)[-1], np.shape(trait)[-1])
+    n_years = (n_steps - offset) // year_len
+    n_windows = n_years - window_years + 1
+    if n_windows < 1:
+        raise ValueError(f"{n_steps} records do not cover a {window_years}-year window")
+
+    used = slice(offset, offset + n_years * year_len)
+    X = _design(n_years * year_len, step_days, period_days, offset).reshape(n_years, year_len, 3)
+
+    def fit(series):
+        y, mean = _centered(_as_members(series)[:, :n_steps])
+        y = y[:, used].reshape(y.shape[0], n_years, year_len)
+        yearly = _normal_sums(y, X)
+        # Running sums over years; window k is the difference of two of them.
+        windows = {}
+        for key, value in yearly.items():
+            total = np.concatenate([np.zeros_like(value[:, :1]), np.cumsum(value, axis=1)], axis=1)
+            windows[key] = total[:, window_years:] - total[:, :n_windows]
+        result = _fit_from_sums(windows)
+        result['mean'] = result['mean'] + mean[:, np.newaxis]
+        return result
+
+    fit_env = fit(env)
+    fit_trait = fit(trait)
+    table = _compare(fit_env, fit_trait, period_days)
+    table['mean_env'] = np.broadcast_to(fit_env['mean'], table['amp_ratio'].shape)
+    table['mean_trait'] = fit_trait['mean']
+    if scalar:
+        table = {key: value[0] for key, value in table.items()}
+    year_start = np.arange(n_windows)
+    table['year_start'] = year_start
+    table['year_end'] = year_start + window_years
+    return table
+
+
+LAG_TABLE_COLUMNS = ['year_start', 'year_end', 'lag_days', 'lag_lo', 'lag_hi',
+                     'amp_env', 'amp_trait', 'amp_ratio', 'amp_ratio_lo', 'amp_ratio_hi',
+                     'mean_env', 'mean_trait']
+
+
+def lag_table_rows(table):
+    """(n_windows, len(LAG_TABLE_COLUMNS)) array of a single-series rolling_seasonal_lag table."""
+    return np.column_stack([table['year_start'], table['year_end'], table['lag_days'],
+                            table['lag_ci'][:, 0], table['lag_ci'][:, 1],
+                            table['amp_env'], table['amp_trait'], table['amp_ratio'],
+                            table['amp_ratio_ci'][:, 0], table['amp_ratio_ci'][:, 1],
+                            table['mean_env'], table['mean_trait']])
+
+
+def save_lag_table(table, filename):
+    """Writes a single-series rolling_seasonal_lag table as CSV, one row per window."""
+    np.savetxt(filename, lag_table_rows(table), delimiter=',', header=','.join(LAG_TABLE_COLUMNS),
+               comments='', fmt=['%d', '%d'] + ['%.6g'] * (len(LAG_TABLE_COLUMNS) - 2))
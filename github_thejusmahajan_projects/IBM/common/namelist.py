@@ -0,0 +1,225 @@
+"""
+Typed reader and layout-preserving writer of the Fortran namelist
+(parameters.nml) read by wcm.x.
+
+The text is scanned once: every `key = value` of every &group is recorded
+with its parsed value (integers, reals including d/D exponents, logicals,
+quoted strings) and the character span of the literal. Writing substitutes
+new literals into those spans only, so spacing, blank lines and inline
+`!` comments are kept, and variants can be generated in memory (e.g. by
+sweep.py) without re-parsing or touching the file on disk.
+"""
+import os
+import re
+
+# key = value, where value is a quoted string or runs up to the next
+# separator; several assignments may share a line, separated by commas.
+_ASSIGN = re.compile(r"""([A-Za-z_]\w*)\s*=\s*('[^']*'|"[^"]*"|[^,/!'"\s][^,/!'"]*?)\s*(?=,|/|!|$)""")
+_GROUP = re.compile(r'^\s*[&$]([A-Za-z_]\w*)')
+_REAL = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eEdD][+-]?\d+)?$')
+
+
+def parse_value(literal):
+    """Python value of one namelist literal; unknown forms are returned as text."""
+    text = literal.strip()
+    lowered = text.lower()
+    if lowered in ('.true.', '.t.', 't', 'true'):
+        return True
+    if lowered in ('.false.', '.f.', 'f', 'false'):
+        return False
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in '\'"':
+        return text[1:-1]
+    if re.fullmatch(r'[+-]?\d+', text):
+        return int(text)
+    if _REAL.match(text):
+        return float(lowered.replace('d', 'e'))
+    return text
+
+
+def fortran_value(value, like=None):
+    """
+    Namelist literal of a Python value (logicals as .true./.false.). Strings
+    are written verbatim. A float replacing a literal with a d exponent
+    keeps double-precision notation, e.g. 0.2 -> 0.2d0 in place of 0.28d0.
+    """
+    if isinstance(value, bool):
+        return '.true.' if value else '.false.'
+    if isinstance(value, float):
+        text = repr(value)
+        if like is not None and re.search(r'\d[dD][+-]?\d', like):
+            mantissa, _, exponent = text.lower().partition('e')
+            return f"{mantissa}d{int(exponent) if exponent else 0}"
+        return text
+    return str(value)
+
+
+class Namelist:
+    """
+    Parsed namelist text. Values are available per group (groups[name][key])
+    or by key alone when it is unique across groups; keys and group names
+    are case-insensitive and stored in lower case.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.lines = text.splitlines(keepends=True)
+        self.groups = {}
+        self._spans = {} # (group, key) -> (line index, start, end) of the literal
+        self._ends = {} # group -> (line index, column) of its closing /
+
+        group = None
+        for i, line in enumerate(self.lines):
+            start = 0
+            if group is None:
+                match = _GROUP.match(line)
+                if not match:
+                    continue
+                group = match.group(1).lower()
+                self.groups.setdefault(group, {})
+                start = match.end()
+            code = self._code(line)
+            for match in _ASSIGN.finditer(code, start):
+                key = match.group(1).lower()
+                self.groups[group][key] = parse_value(match.group(2))
+                self._spans[(group, key)] = (i, match.start(2), match.end(2))
+            end = self._close_at(code, start)
+            if end is not None:
+                self._ends[group] = (i, end)
+                group = None
+
+    @staticmethod
+    def _code(line):
+        """The line without its trailing ! comment (quotes respected)."""
+        quote = None
+        for k, char in enumerate(line):
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in '\'"':
+                quote = char
+            elif char == '!':
+                return line[:k]
+        return line.rstrip('\r\n')
+
+    @staticmethod
+    def _close_at(code, start):
+        """Column of the / that closes the group, or None."""
+        quote = None
+        for k in range(start, len(code)):
+            char = code[k]
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in '\'"':
+                quote = char
+            elif char == '/':
+                return k
+        return None
+
+    def _resolve(self, key):
+        """(group, key) of 'key' or 'group.key'; raises KeyError if absent or ambiguous."""
+        name = key.lower()
+        if '.' in name:
+            group, _, name = name.partition('.')
+            if name not in self.groups.get(group, {}):
+                raise KeyError(key)
+            return group, name
+        owners = [group for group, values in self.groups.items() if name in values]
+        if not owners:
+            raise KeyError(key)
+        if len(owners) > 1:
+            raise KeyError(f"{key} is defined in several groups ({', '.join(owners)}); use group.key")
+        return owners[0], name
+
+    def __getitem__(self, key):
+        group, name = self._resolve(key)
+        return self.groups[group][name]
+
+    def __contains__(self, key):
+        try:
+            self._resolve(key)
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def render(self, updates=None):
+        """
+        The namelist text with the given {key or group.key: value} substituted,
+        everything else unchanged. A group.key that is not in the text yet is
+        added at the end of its group; any other unknown key raises KeyError.
+        """
+        if not updates:
+            return self.text
+        edits = {}
+        inserts = {}
+        for key, value in updates.items():
+            try:
+                group, name = self._resolve(key)
+            except KeyError:
+                group, _, name = key.lower().rpartition('.')
+                if group not in self._ends:
+                    raise
+                i, end = self._ends[group]
+                if self.lines[i][:end].strip():
+                    # / shares its line with assignments: add before it
+                    edits.setdefault(i, []).append((end, end, f"{name} = {fortran_value(value)} "))
+                else:
+                    inserts.setdefault(i, []).append(f"  {name} = {fortran_value(value)}\n")
+                continue
+            i, start, end = self._spans[(group, name)]
+            literal = self.lines[i][start:end]
+            edits.setdefault(i, []).append((start, end, fortran_value(value, like=literal)))
+        lines = list(self.lines)
+        for i, line_edits in edits.items():
+            line = lines[i]
+            for start, end, literal in sorted(line_edits, reverse=True):
+                line = line[:start] + literal + line[end:]
+            lines[i] = line
+        for i, new_lines in inserts.items():
+            lines[i] = ''.join(new_lines) + lines[i]
+        return ''.join(lines)
+
+    def literal(self, key):
+        """The value of key exactly as written in the text."""
+        group, name = self._resolve(key)
+        i, start, end = self._spans[(group, name)]
+        return self.lines[i][start:end]
+
+
+def read_namelist(filename):
+    """Namelist of filename, or None (with a message) if the file does not exist."""
+    if not os.path.exists(filename):
+        print(f"File {filename} not found.")
+        return None
+    with open(filename) as f:
+        return Namelist(f.read())
+
+
+def run_parameters(filenames, defaults):
+    """
+    The keys of defaults read from the first existing file of filenames
+    (e.g. the copy of parameters.nml in the output directory of the run,
+    then the study's own), falling back to the default values.
+    """
+    for filename in filenames:
+        if os.path.exists(filename):
+            namelist = read_namelist(filename)
+            return {key: namelist.get(key, default) for key, default in defaults.items()}
+    print(f"Warning: no parameters.nml found. Using defaults {defaults}")
+    return dict(defaults)
+
+
+def update_namelist_text(text, updates):
+    """
+    Returns (new_text, changes) with the values of the given keys replaced.
+    updates: dict of {key: value}; changes: dict of {key: (old, new)}
+    literals for the keys found. Keys absent from the text are skipped.
+    """
+    namelist = Namelist(text)
+    present = {key: value for key, value in updates.items() if key in namelist}
+    changes = {key: (namelist.literal(key), fortran_value(value, like=namelist.literal(key)))
+               for key, value in present.items()}
+    return namelist.render(present), changes
@@ -0,0 +1,170 @@
+"""
+Persistent columnar cache of parsed wcm.x output.
+
+The first read of an output directory converts fort.10/11/12 into a
+fort_cache/ directory next to the binaries: one uncompressed .npy file per
+column, stripped of the record markers and contiguous, together with a
+JSON manifest of the source fingerprints. Later reads open the columns as
+read-only memory maps, so they cost no more than mapping the fort.* files
+themselves and nothing is loaded until it is used; fort.10 and fort.11 are
+stored as their (n_steps, 2) and (n_steps, 3) blocks so that the readers
+hand them out without a copy. A source file is considered unchanged when
+its size and mtime match the manifest; if only the mtime differs (copied
+or touched file) the content hash decides. Any other change rebuilds the
+store.
+
+Set FORT_CACHE=0 in the environment to bypass the cache entirely.
+"""
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+from fortio import memmap_fort
+
+CACHE_NAME = 'fort_cache'
+CACHE_VERSION = 2
+CACHE_ENABLED = os.environ.get('FORT_CACHE', '1') != '0'
+OUTPUT_DT = 86400.0 # Daily output
+
+# Source file -> (unit, {column: (record field, column index or None)})
+SOURCES = {
+    'fort.10': (10, {'temp_swrad': ('data', None)}),
+    'fort.11': (11, {'aorg_detr_phyt': ('data', None)}),
+    'fort.12': (12, {'nbr_cls': ('nbr_cls', None),
+                     'growthmean0': ('growthmean0', None),
+                     'growthmean': ('growthmean', None)}),
+}
+
+_open_stores = {}
+
+
+def content_hash(filename, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=20)
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(filename):
+    st = os.stat(filename)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': content_hash(filename)}
+
+
+def _is_current(entry, filename):
+    """Checks a manifest entry against the file; returns (current, refreshed_entry)."""
+    st = os.stat(filename)
+    if st.st_size != entry['size']:
+        return False, None
+    if st.st_mtime_ns == entry['mtime_ns']:
+        return True, entry
+    if content_hash(filename) == entry['hash']:
+        return True, dict(entry, mtime_ns=st.st_mtime_ns)
+    return False, None
+
+
+def _paths(output_dir):
+    store_dir = os.path.join(output_dir, CACHE_NAME)
+    return store_dir, os.path.join(store_dir, 'manifest.json')
+
+
+def _present_sources(output_dir):
+    return [name for name in SOURCES if os.path.exists(os.path.join(output_dir, name))]
+
+
+def build_run(output_dir):
+    """Converts the fort.* files of output_dir into the columnar store and returns its manifest."""
+    store_dir, manifest_path = _paths(output_dir)
+    # Built in a directory of its own and swapped in, so a concurrent reader never sees a half-written store.
+    partial_dir = f"{store_dir}.tmp{os.getpid()}"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    os.makedirs(partial_dir)
+    manifest = {'version': CACHE_VERSION, 'sources': {}}
+    n_steps = None
+    for name in _present_sources(output_dir):
+        filename = os.path.join(output_dir, name)
+        manifest['sources'][name] = fingerprint(filename)
+        unit, fields = SOURCES[name]
+        records = memmap_fort(filename, unit)
+        for column, (field, index) in fields.items():
+            values = records[field] if index is None else records[field][:, index]
+            np.save(os.path.join(partial_dir, column + '.npy'), np.ascontiguousarray(values))
+        n_steps = records.shape[0] if n_steps is None else max(n_steps, records.shape[0])
+    if n_steps is not None:
+        np.save(os.path.join(partial_dir, 'time.npy'), np.arange(n_steps) * (OUTPUT_DT / 86400.0)) # Days
+    with open(os.path.join(partial_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    stale_dir = f"{store_dir}.old{os.getpid()}"
+    if os.path.exists(store_dir):
+        os.replace(store_dir, stale_dir)
+    os.replace(partial_dir, store_dir)
+    shutil.rmtree(stale_dir, ignore_errors=True)
+    return manifest
+
+
+def load_run(output_dir, rebuild=False):
+    """
+    Columns of output_dir (time, temp_swrad, aorg_detr_phyt, nbr_cls,
+    growthmean0, growthmean, as far as the sources exist) as a dict of
+    read-only memory maps. Builds or refreshes the store when needed;
+    returns None if the directory has no fort.10/11/12 or cannot be
+    written.
+    """
+    output_dir = os.path.abspath(output_dir)
+    present = _present_sources(output_dir)
+    if not present:
+        return None
+    store_dir, manifest_path = _paths(output_dir)
+
+    manifest = None
+    if not rebuild and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != CACHE_VERSION or sorted(manifest['sources']) != sorted(present):
+            manifest = None
+        else:
+            refreshed = False
+            for name in present:
+                current, entry = _is_current(manifest['sources'][name], os.path.join(output_dir, name))
+                if not current:
+                    manifest = None
+                    break
+                if entry is not manifest['sources'][name]:
+                    manifest['sources'][name] = entry
+                    refreshed = True
+            if manifest is not None and refreshed:
+                with open(manifest_path, 'w') as f:
+                    json.dump(manifest, f, indent=1)
+
+    if manifest is None:
+        try:
+            manifest = build_run(output_dir)
+        except OSError as e:
+            print(f"Warning: could not write cache in {output_dir} ({e}). Reading fort.* directly.")
+            return None
+        _open_stores.pop(output_dir, None)
+
+    stamp = json.dumps(manifest['sources'], sort_keys=True)
+    if output_dir in _open_stores and _open_stores[output_dir][0] == stamp:
+        return _open_stores[output_dir][1]
+    store = {name[:-len('.npy')]: np.load(os.path.join(store_dir, name), mmap_mode='r')
+             for name in os.listdir(store_dir) if name.endswith('.npy')}
+    _open_stores[output_dir] = (stamp, store)
+    return store
+
+
+def cached_columns(filename, columns):
+    """
+    The given columns of a fort.10/11/12 file, served from the store of its
+    directory. Returns None when the file is not cacheable (other names
+    such as fort.11.evolving, caching disabled, unwritable directory).
+    """
+    if not CACHE_ENABLED or os.path.basename(filename) not in SOURCES or not os.path.exists(filename):
+        return None
+    store = load_run(os.path.dirname(filename) or '.')
+    if store is None:
+        return None
+    return [store[column] for column in columns]
@@ -0,0 +1,280 @@
+"""
+Parser and live monitor of the progress table wcm.x prints to stdout.
+
+Every 10 simulated days wcm.F90 writes one fixed-width line,
+WRITE(6,'(3i4,5f10.4,7i9)'), with the date, temperature, the nitrogen
+pools and the agent bookkeeping; `make run` output, the run_*.log files
+and run.log of ensemble runs all contain it. The parser slices the
+columns of all table lines at once (other lines such as "Running model..."
+are skipped, fields overflowed to **** become NaN / -1) into a structured
+array. LogTail reads only the lines appended since the previous poll, and
+the monitor reports simulated years per wall second, the projected end of
+the run and how close the agent arrays get to their size limit M2.
+
+Usage (from a study directory):
+    python3 ../../common/runlog.py run_hindcast_evolving.log --csv plots/hindcast_log.csv
+    make run > run.log &  python3 ../../common/runlog.py run.log --follow
+
+gfortran buffers stdout written to a file; run the model with
+GFORTRAN_UNBUFFERED_PRECONNECTED=y (ensemble.py does) for line-by-line
+progress.
+"""
+import argparse
+import os
+import re
+import time as walltime
+import numpy as np
+
+from namelist import run_parameters
+
+DAYS_PER_YEAR = 360
+DAYS_PER_MONTH = 30
+PRINT_EVERY_DAYS = 10 # the last line of a run is printed 10 days before its end
+
+# (name, width, kind) of the fields of '(3i4,5f10.4,7i9)'
+LOG_FIELDS = [
+    ('year', 4, 'i'), ('month', 4, 'i'), ('day', 4, 'i'),
+    ('temp', 10, 'f'), ('aorg', 10, 'f'), ('detr', 10, 'f'), ('phyt', 10, 'f'), ('total_n', 10, 'f'),
+    ('icnt', 9, 'i'),    # slots in use, COUNT(iliv.ne.0)
+    ('m2max', 9, 'i'),   # active array extent M2max
+    ('alive', 9, 'i'),   # COUNT(iliv.eq.1)
+    ('dead', 9, 'i'),    # COUNT(iliv.eq.-1)
+    ('dormant', 9, 'i'), # COUNT(iliv.eq.2)
+    ('gen_min', 9, 'i'), ('gen_max', 9, 'i'),
+]
+LINE_WIDTH = sum(width for _, width, _ in LOG_FIELDS)
+LOG_DTYPE = np.dtype([(name, np.int64 if kind == 'i' else np.float64) for name, _, kind in LOG_FIELDS])
+_RAW_DTYPE = np.dtype([(name, f'S{width}') for name, width, _ in LOG_FIELDS])
+_TABLE_LINE = re.compile(rb'^[ 0-9.*+-]{%d}$' % LINE_WIDTH)
+
+
+def _convert(raw):
+    out = np.empty(raw.shape[0], dtype=LOG_DTYPE)
+    for name, _, kind in LOG_FIELDS:
+        try:
+            out[name] = raw[name].astype(out.dtype[name])
+        except ValueError: # **** in some rows
+            missing = np.nan if kind == 'f' else -1
+            out[name] = [missing if b'*' in value else value for value in raw[name]]
+    return out
+
+
+def parse_lines(data):
+    """Structured array (LOG_DTYPE) of the table lines in a bytes block of complete lines."""
+    lines = [line for line in data.splitlines() if _TABLE_LINE.match(line)]
+    if not lines:
+        return np.zeros(0, dtype=LOG_DTYPE)
+    raw = np.frombuffer(b''.join(lines), dtype=_RAW_DTYPE)
+    return _convert(raw)
+
+
+class LogTail:
+    """Incremental reader of the table lines appended to a log file."""
+
+    def __init__(self, filename, chunk_size=1 << 22):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.offset = 0
+
+    def poll(self):
+        """Rows completed since the last poll (possibly none); a partial last line is left for later."""
+        if not os.path.exists(self.filename):
+            return None
+        blocks = []
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            rest = b''
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                chunk = rest + chunk
+                end = chunk.rfind(b'\n') + 1
+                if end:
+                    blocks.append(parse_lines(chunk[:end]))
+                    self.offset += end
+                rest = chunk[end:]
+        if not blocks:
+            return np.zeros(0, dtype=LOG_DTYPE)
+        return np.concatenate(blocks)
+
+
+def read_log(filename):
+    """All table rows of a log file, or None if it does not exist."""
+    return LogTail(filename).poll()
+
+
+def simulated_days(rows):
+    """Simulated time of each row in days (the first line, month 0 day 0, is the start)."""
+    days = (rows['year'] - 1) * DAYS_PER_YEAR + (rows['month'] - 1) * DAYS_PER_MONTH + rows['day']
+    return np.maximum(days, 0).astype(float)
+
+
+def to_dataframe(rows):
+    """The rows as a pandas DataFrame with a sim_years column."""
+    import pandas as pd
+    frame = pd.DataFrame(rows)
+    frame.insert(3, 'sim_years', simulated_days(rows) / DAYS_PER_YEAR)
+    return frame
+
+
+def save_log_table(rows, filename):
+    """Writes the rows (plus sim_years) as CSV."""
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    names = [name for name, _, _ in LOG_FIELDS]
+    columns = [simulated_days(rows) / DAYS_PER_YEAR] + [rows[name] for name in names]
+    fmt = ['%.4f'] + ['%d' if kind == 'i' else '%.4f' for _, _, kind in LOG_FIELDS]
+    np.savetxt(filename, np.column_stack(columns), delimiter=',', fmt=fmt,
+               header=','.join(['sim_years'] + names), comments='')
+
+
+def array_limit(src_dir='src'):
+    """M2 (agent array size) from wcm_arrays.f90, or None."""
+    path = os.path.join(src_dir, 'wcm_arrays.f90')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        match = re.search(r'\bM2\s*=\s*(\d+)', f.read())
+    return int(match.group(1)) if match else None
+
+
+def limit_report(rows, m2, window_years=1.0):
+    """
+    How close the agent arrays are to M2: current and peak use of M2max, and
+    the simulated years until M2 at the linear growth of the last window.
+    """
+    if m2 is None or rows.shape[0] == 0:
+        return {}
+    years = simulated_days(rows) / DAYS_PER_YEAR
+    recent = years >= years[-1] - window_years
+    growth = np.nan
+    if np.count_nonzero(recent) >= 3 and np.ptp(years[recent]) > 0:
+        growth = np.polyfit(years[recent], rows['m2max'][recent].astype(float), 1)[0] # slots / sim-year
+    headroom = max(m2 - rows['m2max'][-1], 0)
+    to_limit = headroom / growth if growth > 0 else (0.0 if headroom == 0 else np.inf)
+    return {'m2': m2, 'use': rows['m2max'][-1] / m2, 'peak_use': rows['m2max'].max() / m2,
+            'growth_per_year': growth, 'years_to_limit': to_limit}
+
+
+class Progress:
+    """Simulated years per wall second from the arrival times of new rows."""
+
+    def __init__(self, nyears=None, window_seconds=120.0):
+        self.nyears = nyears
+        self.window_seconds = window_seconds
+        self.samples = [] # (wall time, simulated years)
+
+    def add(self, rows, now=None):
+        if rows is not None and rows.shape[0]:
+            now = walltime.time() if now is None else now
+            self.samples.append((now, simulated_days(rows[-1:])[0] / DAYS_PER_YEAR))
+        return self
+
+    @property
+    def years(self):
+        return self.samples[-1][1] if self.samples else 0.0
+
+    def rate(self):
+        """Simulated years per wall second over the recent window, NaN until two samples."""
+        if len(self.samples) < 2:
+            return np.nan
+        t_end = self.samples[-1][0]
+        window = [s for s in self.samples if s[0] >= t_end - self.window_seconds]
+        if len(window) < 2:
+            window = self.samples[-2:]
+        (t0, y0), (t1, y1) = window[0], window[-1]
+        return (y1 - y0) / (t1 - t0) if t1 > t0 else np.nan
+
+    def eta_seconds(self):
+        rate = self.rate()
+        if self.nyears is None or not rate > 0:
+            return np.nan
+        return max(self.nyears - self.years, 0.0) / rate
+
+
+def format_status(rows, progress, limit):
+    last = rows[-1]
+    parts = [f"Year {progress.years:7.3f}" + (f"/{progress.nyears}" if progress.nyears else ""),
+             f"Temp {last['temp']:7.3f}", f"Agents {last['alive']:7d}"]
+    rate = progress.rate()
+    if np.isfinite(rate):
+        parts.append(f"{rate:.4f} sim-yr/s ({rate * 3600.0:.1f}/h)")
+    eta = progress.eta_seconds()
+    if np.isfinite(eta):
+        done = walltime.strftime('%H:%M:%S', walltime.localtime(walltime.time() + eta))
+        parts.append(f"ETA {eta / 60.0:.1f} min ({done})")
+    if limit:
+        text = f"M2max {last['m2max']}/{limit['m2']} ({100 * limit['use']:.0f}%)"
+        if np.isfinite(limit['years_to_limit']):
+            text += f", full in {limit['years_to_limit']:.1f} sim-yr"
+        parts.append(text)
+    return ' | '.join(parts)
+
+
+def monitor(filename, nyears=None, m2=None, poll_seconds=5.0, idle_timeout=600.0):
+    """Follows a growing log until nyears are reached or it stops growing; returns all rows."""
+    tail = LogTail(filename)
+    progress = Progress(nyears)
+    parts = []
+    last_change = walltime.time()
+    while True:
+        rows = tail.poll()
+        if rows is not None and rows.shape[0]:
+            parts.append(rows)
+            progress.add(rows)
+            last_change = walltime.time()
+            table = np.concatenate(parts)
+            parts = [table]
+            print(format_status(table, progress, limit_report(table, m2)), flush=True)
+        if nyears is not None and progress.years * DAYS_PER_YEAR >= nyears * DAYS_PER_YEAR - PRINT_EVERY_DAYS:
+            break
+        if walltime.time() - last_change > idle_timeout:
+            print(f"No new output for {idle_timeout:.0f} s, stopping.")
+            break
+        walltime.sleep(poll_seconds)
+    return parts[0] if parts else np.zeros(0, dtype=LOG_DTYPE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse or follow the progress table of a wcm.x log.")
+    parser.add_argument('logs', nargs='+', help="Log files (stdout of wcm.x)")
+    parser.add_argument('--follow', action='store_true', help="Follow a running model (first log only)")
+    parser.add_argument('--nyears', type=int, default=None, help="Length of the run (default: the namelist's nyears)")
+    parser.add_argument('--src', default='src', help="Source directory holding M2 in wcm_arrays.f90")
+    parser.add_argument('--poll', type=float, default=5.0, help="Seconds between polls")
+    parser.add_argument('--csv', default=None, help="Write the rows of a single log to this CSV file")
+    args = parser.parse_args()
+
+    m2 = array_limit(args.src)
+    if args.follow:
+        nyears = args.nyears
+        if nyears is None:
+            nyears = run_parameters([os.path.join(os.path.dirname(args.logs[0]), 'parameters.nml'), 'parameters.nml'],
+                                    {'nyears': None})['nyears']
+        rows = monitor(args.logs[0], nyears, m2, args.poll)
+    else:
+        for filename in args.logs:
+            t0 = walltime.perf_counter()
+            rows = read_log(filename)
+            if rows is None:
+                print(f"File {filename} not found.")
+                continue
+            if rows.shape[0] == 0:
+                print(f"{filename}: no table lines")
+                continue
+            limit = limit_report(rows, m2)
+            years = simulated_days(rows)[-1] / DAYS_PER_YEAR
+            text = (f"{filename}: {rows.shape[0]} rows, {years:.2f} sim-years, agents {rows['alive'][-1]} "
+                    f"(max {rows['alive'].max()}), generations {rows['gen_min'][-1]}-{rows['gen_max'][-1]}")
+            if limit and limit['peak_use'] <= 1.0:
+                text += f", peak M2max {100 * limit['peak_use']:.0f}% of M2={m2}"
+            else: # no M2 known, or the log comes from a build with larger arrays
+                text += f", peak M2max {rows['m2max'].max()}"
+            print(text + f" [{1e3 * (walltime.perf_counter() - t0):.1f} ms]")
+    if args.csv and rows is not None and rows.shape[0]:
+        save_log_table(rows, args.csv)
+        print(f"Generated {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Gaussian smoothing of the trait density field, tile by tile.
+
+The evolution plots smooth the (n_bins, n_steps) histogram of fort.12 with
+gaussian_filter(sigma=(1, 1)), which on the whole matrix needs a float64
+copy of the input and another of the output. smooth_density instead reads
+the time-major (n_steps, n_bins) histogram, e.g. the memory map of
+fortio.memmap_fort, in tiles of tile_steps records, each extended by a
+halo of the filter radius (int(truncate * sigma + 0.5) records) on both
+sides. Each tile is filtered in float32 and only its interior is kept, so
+the result equals the filter of the whole matrix while at most one tile
+and its halo are held in memory. The result is written tile by tile to an
+in-memory array or, with filename, to a time-major .npy file that is
+returned as a read-only memory map, so a multi-century or concatenated
+ensemble field can be smoothed once and opened by several figures.
+
+Usage:
+    python3 ../../common/smoothing.py output/fort.12 output/density_smooth.npy
+"""
+import argparse
+import os
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+from fortio import memmap_fort
+
+TILE_STEPS = 4096
+
+
+def gaussian_radius(sigma, truncate=4.0):
+    """Half-width of scipy's Gaussian kernel, in samples."""
+    return int(truncate * float(sigma) + 0.5)
+
+
+def smooth_density(dist_data, sigma=(1.0, 1.0), filename=None, tile_steps=TILE_STEPS, truncate=4.0):
+    """
+    gaussian_filter(dist_data.T, sigma) of a (n_steps, n_bins) histogram,
+    as a (n_bins, n_steps) float32 array: sigma is (trait bins, time steps)
+    as in the scripts. With filename the tiles are written to that .npy
+    file (time-major, replaced atomically) and the transposed read-only
+    memory map is returned.
+    """
+    n_steps, n_bins = dist_data.shape
+    sigma_bins, sigma_steps = sigma
+    halo = gaussian_radius(sigma_steps, truncate)
+    tile_steps = max(int(tile_steps), 1)
+
+    if filename is None:
+        out = np.empty((n_steps, n_bins), dtype=np.float32)
+    else:
+        partial = filename + '.tmp'
+        out = np.lib.format.open_memmap(partial, mode='w+', dtype=np.float32, shape=(n_steps, n_bins))
+    for start in range(0, n_steps, tile_steps):
+        stop = min(start + tile_steps, n_steps)
+        lo, hi = max(start - halo, 0), min(stop + halo, n_steps)
+        # At the ends of the run the tile has no halo there and the filter's reflection applies, as for the whole matrix
+        tile = gaussian_filter(np.asarray(dist_data[lo:hi], dtype=np.float32), sigma=(sigma_steps, sigma_bins),
+                               truncate=truncate, output=np.float32)
+        out[start:stop] = tile[start - lo:stop - lo]
+    if filename is None:
+        return out.T
+
+    out.flush()
+    del out
+    os.replace(partial, filename)
+    return load_density(filename)
+
+
+def load_density(filename):
+    """A smoothed density written by smooth_density, as a read-only (n_bins, n_steps) memory map."""
+    return np.load(filename, mmap_mode='r').T
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gaussian smoothing of the fort.12 trait histogram, tile by tile.")
+    parser.add_argument('fort12', help="fort.12 file")
+    parser.add_argument('output', help="Output .npy file (time-major float32)")
+    parser.add_argument('--sigma', type=float, nargs=2, default=(1.0, 1.0), metavar=('BINS', 'STEPS'),
+                        help="Standard deviation along the trait bins and the time steps")
+    parser.add_argument('--tile', type=int, default=TILE_STEPS, help="Records per tile")
+    args = parser.parse_args()
+
+    density = smooth_density(memmap_fort(args.fort12, 12)['nbr_cls'], tuple(args.sigma), args.output, args.tile)
+    print(f"Generated {args.output} ({density.shape[0]} bins x {density.shape[1]} steps)")
+
+
+if __name__ == "__main__":
+    main()
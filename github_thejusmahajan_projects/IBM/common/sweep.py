@@ -0,0 +1,233 @@
+"""
+Parameter sweeps of wcm.x over the model_params / bio_params namelists.
+
+A design (full grid, Latin hypercube or scrambled Sobol) is expanded into
+one namelist text per point and replicate, generated in memory from the
+study's parameters.nml. All variants are dispatched through ensemble.py, so
+every run gets its own content-addressed directory; a sweep that is
+launched again reuses the runs that already finished and only repeats the
+missing or failed ones. Per-run metrics (final mean T_opt, seasonal lag,
+amplitude ratio, sigma, biomass) are stored in metrics.json of the run
+directory, so reused runs are not analysed again, and gathered into one
+CSV table.
+
+Usage (from a study directory, after `make`):
+    python3 ../../common/sweep.py --design grid --param kn 0.1 0.15 0.2 --param mutation_width 0.1 0.2
+    python3 ../../common/sweep.py --design lhs --param mu_max_day 0.5 1.5 --param kn 0.05 0.3 --samples 32
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import warnings
+import numpy as np
+
+from builds import add_build_arguments, binary_from_arguments
+from ensemble import BUDGET_GB, make_job, plan_threads, prune_runs, run_ensemble
+from fitting import fit_gaussians
+from fortio import read_fort10, read_fort11, read_fort12
+from lag import seasonal_lag
+from namelist import Namelist, parse_value
+from traits import trait_moments
+
+DAYS_PER_YEAR = 360
+METRICS_NAME = 'metrics.json'
+METRICS_VERSION = 1 # bump when a metric changes meaning
+METRIC_COLUMNS = ['final_mean_topt', 'final_sigma', 'final_agents', 'lag_days', 'amp_ratio',
+                  'mean_phyt_last_year', 'final_phyt']
+
+
+def grid_design(levels):
+    """Every combination of levels = {key: [values]}, as a list of {key: value}."""
+    keys = list(levels)
+    return [dict(zip(keys, values)) for values in itertools.product(*(levels[k] for k in keys))]
+
+
+def _scale(unit, ranges):
+    points = []
+    for row in unit:
+        point = {}
+        for u, (key, (low, high)) in zip(row, ranges.items()):
+            value = low + u * (high - low)
+            # Integer bounds (e.g. nyears) give integer values
+            point[key] = int(round(value)) if isinstance(low, int) and isinstance(high, int) else float(value)
+        points.append(point)
+    return points
+
+
+def lhs_design(ranges, n, seed=0):
+    """n Latin-hypercube points over ranges = {key: (low, high)}."""
+    from scipy.stats import qmc
+    return _scale(qmc.LatinHypercube(d=len(ranges), seed=seed).random(n), ranges)
+
+
+def sobol_design(ranges, n, seed=0):
+    """n scrambled Sobol points over ranges = {key: (low, high)}; n a power of 2 keeps the balance properties."""
+    from scipy.stats import qmc
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        unit = qmc.Sobol(d=len(ranges), scramble=True, seed=seed).random(n)
+    return _scale(unit, ranges)
+
+
+def expand(base_namelist, points):
+    """
+    Namelist text of every design point; the base text is parsed once. Raises
+    KeyError for a parameter that does not appear in the base namelist, so a
+    misspelt key cannot silently run the base configuration.
+    """
+    base = Namelist(base_namelist)
+    missing = sorted({key for point in points for key in point if key not in base})
+    if missing:
+        raise KeyError(f"Not in namelist: {', '.join(missing)}")
+    return [base.render(point) for point in points]
+
+
+def run_metrics(run_dir, output_dt=86400.0):
+    """
+    Summary metrics of one finished run, NaN where the run is too short.
+    Computed once and kept in metrics.json of the run directory.
+    """
+    path = os.path.join(run_dir, METRICS_NAME)
+    stamp = {'version': METRICS_VERSION, 'output_dt': output_dt}
+    if os.path.exists(path):
+        with open(path) as f:
+            stored = json.load(f)
+        if stored.get('stamp') == stamp and sorted(stored['metrics']) == sorted(METRIC_COLUMNS):
+            return {key: np.nan if value is None else value for key, value in stored['metrics'].items()}
+
+    metrics = _compute_metrics(run_dir, output_dt)
+    with open(path, 'w') as f:
+        json.dump({'stamp': stamp,
+                   'metrics': {key: None if np.isnan(value) else float(value) for key, value in metrics.items()}},
+                  f, indent=1)
+    return metrics
+
+
+def _compute_metrics(run_dir, output_dt):
+    metrics = dict.fromkeys(METRIC_COLUMNS, np.nan)
+    data10 = read_fort10(os.path.join(run_dir, 'fort.10'), use_cache=False)
+    data11 = read_fort11(os.path.join(run_dir, 'fort.11'), use_cache=False)
+    data12 = read_fort12(os.path.join(run_dir, 'fort.12'), use_cache=False)
+    if data10 is None or data11 is None or data12 is None or len(data12) == 0:
+        return metrics
+
+    year_len = int(round(DAYS_PER_YEAR * 86400.0 / output_dt))
+    moments = trait_moments(data12, fractions=False)
+    fit = fit_gaussians(data12[-1:])
+    metrics['final_mean_topt'] = moments['mean'][-1]
+    metrics['final_agents'] = moments['count'][-1]
+    metrics['final_sigma'] = fit['sigma'][0] if fit['converged'][0] else np.nan
+    metrics['final_phyt'] = data11[-1, 2]
+    metrics['mean_phyt_last_year'] = np.mean(data11[-year_len:, 2])
+
+    # Benchmark B over the last two years (at least one full year needed)
+    n = min(len(data10), len(moments['mean']))
+    window = min(2 * year_len, n - 1)
+    if window >= year_len:
+        lag = seasonal_lag(data10[n - window:n, 0], moments['mean'][n - window:n], step_days=output_dt / 86400.0)
+        metrics['lag_days'] = lag['lag_days']
+        metrics['amp_ratio'] = lag['amp_ratio']
+    return metrics
+
+
+def run_sweep(binary, base_namelist, points, runs_dir='runs', replicates=1, threads=None,
+              retries=1, table_file=None, budget_gb=BUDGET_GB):
+    """
+    Runs every point x replicate and returns the results table as a list of
+    rows (dicts). Failed runs are retried up to retries times; finished runs
+    from earlier invocations are reused. budget_gb limits the size of
+    runs_dir (see ensemble.prune_runs).
+    """
+    variants = expand(base_namelist, points)
+    jobs = []
+    rows = []
+    for p, (point, text) in enumerate(zip(points, variants)):
+        for replicate in range(replicates):
+            jobs.append(make_job(text, replicate, label=f'p{p:04d}_r{replicate:02d}'))
+            rows.append(dict({'point': p, 'replicate': replicate}, **point))
+
+    # Fixed for the retries too: the thread count is part of a run's key
+    threads = plan_threads(len(jobs), threads)[1]
+    manifests = run_ensemble(binary, jobs, runs_dir, threads, budget_gb=None)
+    for attempt in range(retries):
+        failed = [i for i, m in enumerate(manifests) if m['status'] != 'done']
+        if not failed:
+            break
+        print(f"Retrying {len(failed)} failed runs ({attempt + 1}/{retries})")
+        for i, manifest in zip(failed, run_ensemble(binary, [jobs[i] for i in failed], runs_dir, threads,
+                                                              budget_gb=None)):
+            manifests[i] = manifest
+
+    for row, manifest in zip(rows, manifests):
+        row['status'] = manifest['status']
+        row['wall_time_s'] = manifest.get('wall_time_s', np.nan)
+        row.update(run_metrics(manifest['run_dir']) if manifest['status'] == 'done'
+                   else dict.fromkeys(METRIC_COLUMNS, np.nan))
+        row['run_dir'] = manifest['run_dir']
+
+    # Evict only once every run of this sweep has been analysed
+    if budget_gb is not None:
+        prune_runs(runs_dir, budget_gb * 1e9, protect={os.path.basename(m['run_dir']) for m in manifests})
+    if table_file:
+        save_table(rows, table_file)
+    return rows
+
+
+def save_table(rows, filename):
+    """Writes sweep rows as CSV; parameter columns come between replicate and status."""
+    if not rows:
+        return
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: f'{value:.6g}' if isinstance(value, (float, np.floating)) else value
+                             for key, value in row.items()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep wcm.x parameters over a grid, LHS or Sobol design.")
+    parser.add_argument('--design', choices=['grid', 'lhs', 'sobol'], default='grid')
+    parser.add_argument('--param', nargs='+', action='append', required=True, metavar=('KEY', 'VALUE'),
+                        help="grid: KEY v1 v2 ...; lhs/sobol: KEY low high")
+    parser.add_argument('--samples', type=int, default=16, help="Number of points for lhs/sobol")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the lhs/sobol design")
+    parser.add_argument('--replicates', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=None, help="OpenMP threads per run (default: share the cores)")
+    parser.add_argument('--retries', type=int, default=1, help="Retries of failed runs")
+    parser.add_argument('--binary', default='output/wcm.x')
+    parser.add_argument('--namelist', default='parameters.nml', help="Base namelist")
+    parser.add_argument('--runs-dir', default='runs')
+    parser.add_argument('--table', default='plots/sweep_results.csv')
+    parser.add_argument('--budget-gb', type=float, default=BUDGET_GB,
+                        help="Evict least recently used runs beyond this size (default: $WCM_RUNS_BUDGET_GB, no limit)")
+    add_build_arguments(parser)
+    args = parser.parse_args()
+
+    spec = {values[0]: [parse_value(v) for v in values[1:]] for values in args.param}
+    if args.design == 'grid':
+        points = grid_design(spec)
+    else:
+        bad = [key for key, values in spec.items() if len(values) != 2]
+        if bad:
+            parser.error(f"{args.design} needs KEY low high for: {', '.join(bad)}")
+        ranges = {key: tuple(values) for key, values in spec.items()}
+        design = lhs_design if args.design == 'lhs' else sobol_design
+        points = design(ranges, args.samples, args.seed)
+
+    with open(args.namelist) as f:
+        base = f.read()
+    rows = run_sweep(binary_from_arguments(args), base, points, args.runs_dir, args.replicates, args.threads,
+                     args.retries, args.table, args.budget_gb)
+    n_done = sum(row['status'] == 'done' for row in rows)
+    print(f"{n_done}/{len(rows)} runs done. Generated {args.table}")
+    if n_done < len(rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common'))
+from fortio import read_fort12
+from derived import trait_series
+from fitting import fit_recovery, save_recovery_table
+
+# Configuration
+DATA_DIR = "output"
+PLOT_DIR = "plots"
+os.makedirs(PLOT_DIR, exist_ok=True)
+
+# Parameters
+OUTPUT_DT = 86400.0 # Daily output
+T_JUMP = 1.0 # Years, start value for the fitted jump time
+
+def fit_tau(data_dirs, table_file=f"{PLOT_DIR}/tau_fits.csv"):
+    """
+    Adaptation time scale of a set of temperature-jump runs (e.g. a sweep
+    over mutation_width, tslope_cold, tslope_hot): the mean T_opt series of
+    all runs are fitted together and written to one table.
+    """
+    runs = []
+    series = []
+    for data_dir in data_dirs:
+        data12 = read_fort12(f"{data_dir}/fort.12")
+        if data12 is None:
+            continue
+        runs.append(data_dir)
+        series.append(trait_series(f"{data_dir}/fort.12", data12)['mean'])
+    if not series:
+        return None
+
+    # Runs of different length are compared over their common span
+    n_steps = min(len(s) for s in series)
+    stack = np.stack([s[:n_steps] for s in series])
+    time = np.arange(n_steps) * (OUTPUT_DT / 86400.0) / 360.0 # Years
+
+    fits = fit_recovery(time, stack, t_jump=T_JUMP)
+    save_recovery_table(fits, table_file, runs)
+
+    ok = fits['converged']
+    print(f"Fitted {len(runs)} runs ({np.count_nonzero(ok)} converged) over {time[-1]:.2f} years")
+    if np.any(ok):
+        print(f"  tau: median {np.median(fits['tau'][ok]) * 12.0:.1f} months, "
+              f"range {fits['tau'][ok].min() * 12.0:.1f} - {fits['tau'][ok].max() * 12.0:.1f} months")
+    print(f"Generated {table_file}")
+    return fits
+
+if __name__ == "__main__":
+    # Usage: python3 scripts/fit_tau.py [output_dir ...]
+    fit_tau(sys.argv[1:] or [DATA_DIR])
@@ -1,7 +1,10 @@
 import argparse
-import re
+import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common'))
+from namelist import update_namelist_text
+
 def update_namelist(filename, updates):
     """
     Updates parameters in a Fortran namelist file.
@@ -9,32 +12,19 @@ def update_namelist(filename, updates):
     """
     try:
         with open(filename, 'r') as f:
-            lines = f.readlines()
+            text = f.read()
     except FileNotFoundError:
         print(f"Error: File {filename} not found.")
         sys.exit(1)
 
-    new_lines = []
-    for line in lines:
-        updated_line = line
-        # Check if line contains any of the keys
-        for key, value in updates.items():
-            # Regex to match "key = value" or "key=value", case insensitive
-            # Ignores comments starting with !
-            # Captures the value part to replace it
-            pattern = re.compile(r'^\s*' + re.escape(key) + r'\s*=\s*([^!]+)(.*)', re.IGNORECASE)
-            match = pattern.match(line)
-            if match:
-                current_val = match.group(1).strip()
-                comment = match.group(2)
-                # Replace the value
-                updated_line = line.replace(current_val, str(value), 1)
-                print(f"Updated {key}: {current_val} -> {value}")
-                break # Only update one key per line
-        new_lines.append(updated_line)
+    new_text, changes = update_namelist_text(text, updates)
+    for key, (current_val, value) in changes.items():
+        print(f"Updated {key}: {current_val} -> {value}")
+    for key in updates.keys() - changes.keys():
+        print(f"Warning: {key} not found in {filename}")
 
     with open(filename, 'w') as f:
-        f.writelines(new_lines)
+        f.write(new_text)
 
 def main():
     parser = argparse.ArgumentParser(description="Update Fortran namelist parameters.")
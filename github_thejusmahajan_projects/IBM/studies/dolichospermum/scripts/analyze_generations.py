@@ -0,0 +1,73 @@
+import numpy as np
+import matplotlib.pyplot as plt
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common'))
+from fortio import read_fort13
+from generations import generation_turnover
+from traits import stream_ibm_vs_eulerian
+
+# Configuration
+DATA_DIR = "output"
+PLOT_DIR = "plots"
+os.makedirs(PLOT_DIR, exist_ok=True)
+
+# Parameters
+OUTPUT_DT = 86400.0 # Daily output
+
+def analyze_generations(data_dir):
+    """
+    Generation turnover (fort.13) and IBM vs Eulerian trait moments
+    (fort.12 nbr_cls vs fort.14 strain).
+    """
+    data13 = read_fort13(f"{data_dir}/fort.13")
+    if data13 is None:
+        return
+    if not os.path.exists(f"{data_dir}/fort.12") or not os.path.exists(f"{data_dir}/fort.14"):
+        print(f"fort.12/fort.14 not found in {data_dir}.")
+        return
+
+    turnover = generation_turnover(data13, OUTPUT_DT)
+    moments = stream_ibm_vs_eulerian(f"{data_dir}/fort.12", f"{data_dir}/fort.14")
+    ibm, eul = moments['ibm'], moments['eulerian']
+
+    time = turnover['time'] / 360.0 # Years
+    n_steps = min(len(time), len(ibm['mean']), len(eul['mean']))
+
+    print(f"Generation Turnover:")
+    print(f"  Final Generation Range: {turnover['gen_min'][-1]:.0f} - {turnover['gen_max'][-1]:.0f}")
+    print(f"  Turnover Rate: {turnover['rate']:.4f} generations/day ({turnover['rate'] * 360.0:.1f} per year)")
+    print(f"Trait Moments (Final Step):")
+    print(f"  IBM:      Mean T_opt = {ibm['mean'][n_steps-1]:.4f} deg C, Std Dev = {np.sqrt(ibm['variance'][n_steps-1]):.4f} deg C")
+    print(f"  Eulerian: Mean T_opt = {eul['mean'][n_steps-1]:.4f} deg C, Std Dev = {np.sqrt(eul['variance'][n_steps-1]):.4f} deg C")
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+
+    ax1.fill_between(time, turnover['gen_min'], turnover['gen_max'], color='grey', alpha=0.4, label='Generation Range')
+    ax1.plot(time, turnover['gen_max'], 'k-', linewidth=1.0, label='Max Generation')
+    ax1.set_ylabel('Generation')
+    ax1.set_title('Generation Turnover')
+    ax1.legend(loc='upper left')
+    ax1.grid(True, alpha=0.3)
+
+    t = time[:n_steps]
+    ax2.plot(t, ibm['mean'][:n_steps], 'r-', linewidth=1.5, label='IBM Mean $T_{opt}$')
+    ax2.fill_between(t, ibm['mean'][:n_steps] - np.sqrt(ibm['variance'][:n_steps]),
+                     ibm['mean'][:n_steps] + np.sqrt(ibm['variance'][:n_steps]), color='red', alpha=0.2)
+    ax2.plot(t, eul['mean'][:n_steps], 'b--', linewidth=1.5, label='Eulerian Mean $T_{opt}$')
+    ax2.fill_between(t, eul['mean'][:n_steps] - np.sqrt(eul['variance'][:n_steps]),
+                     eul['mean'][:n_steps] + np.sqrt(eul['variance'][:n_steps]), color='blue', alpha=0.2)
+    ax2.set_ylabel('Optimal Temperature ($T_{opt}$) [°C]')
+    ax2.set_xlabel('Time [Years]')
+    ax2.set_title('Trait Moments: IBM vs Eulerian')
+    ax2.legend(loc='lower right')
+    ax2.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(f"{PLOT_DIR}/generations_and_moments.png", dpi=300)
+    plt.close()
+    print("Generated generations_and_moments.png")
+
+if __name__ == "__main__":
+    analyze_generations(sys.argv[1] if len(sys.argv) > 1 else DATA_DIR)
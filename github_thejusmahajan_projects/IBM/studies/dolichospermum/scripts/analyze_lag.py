@@ -1,11 +1,14 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.io import FortranFile
-from scipy.ndimage import gaussian_filter
-from scipy.signal import correlate
 import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common'))
+from fortio import read_fort10, read_fort12
+from derived import trait_series
+from traits import trait_axis
+from lag import seasonal_lag
+
 # Configuration
 PLOT_DIR = "plots"
 os.makedirs(PLOT_DIR, exist_ok=True)
@@ -13,95 +16,20 @@ os.makedirs(PLOT_DIR, exist_ok=True)
 # Parameters
 OUTPUT_DT = 86400.0 # Daily output
 
-def read_fort10(filename):
-    data = []
-    try:
-        f = FortranFile(filename, 'r')
-        while True:
-            try:
-                record = f.read_record(dtype=np.float64)
-                data.append(record)
-            except Exception:
-                break
-        f.close()
-    except FileNotFoundError:
-        print(f"File {filename} not found.")
-        return None
-    return np.array(data)
-
-def read_fort12(filename):
-    dist_data = []
-    try:
-        f = FortranFile(filename, 'r')
-        while True:
-            try:
-                record_bytes = f.read_record(dtype=np.byte)
-                nbr_cls = np.frombuffer(record_bytes[:804], dtype=np.int32)
-                dist_data.append(nbr_cls)
-            except Exception:
-                break
-        f.close()
-    except FileNotFoundError:
-        print(f"File {filename} not found.")
-        return None
-    return np.array(dist_data)
-
 def calculate_lag(time, env_temp, mean_topt):
     """
     Calculate lag between environmental temperature and mean trait.
-    Focus on the last 5 years to ensure steady state.
+    Focus on the last half of the run to ensure steady state.
+    Returns the seasonal_lag result: lag_days (positive when the trait lags
+    the environment) with its 95% interval lag_ci, and the amplitude ratio.
     """
     n_steps = len(time)
     start_idx = n_steps // 2 # Last half
     
-    t_segment = time[start_idx:]
     env_segment = env_temp[start_idx:]
     trait_segment = mean_topt[start_idx:]
     
-    # Normalize
-    env_norm = (env_segment - np.mean(env_segment)) / np.std(env_segment)
-    trait_norm = (trait_segment - np.mean(trait_segment)) / np.std(trait_segment)
-    
-    # Cross-correlation
-    correlation = correlate(env_norm, trait_norm, mode='full')
-    lags = np.arange(-len(env_norm) + 1, len(env_norm))
-    
-    lag_idx = lags[np.argmax(correlation)]
-    lag_days = lag_idx * (OUTPUT_DT / 86400.0)
-    
-    # Positive lag means env leads trait (trait lags behind env)
-    # Wait, correlate(a, b). If a is shifted right relative to b, peak is at positive lag?
-    # Let's verify. If env peaks at t=100 and trait at t=110.
-    # env(t) ~ trait(t-10).
-    # correlate(env, trait). env is "fixed". trait slides.
-    # We need to shift trait to the LEFT (negative lag) to match env?
-    # Or shift env to the RIGHT?
-    
-    # Let's use peak finding for simplicity and robustness.
-    from scipy.signal import find_peaks
-    
-    peaks_env, _ = find_peaks(env_segment, distance=300)
-    peaks_trait, _ = find_peaks(trait_segment, distance=300)
-    
-    if len(peaks_env) == 0 or len(peaks_trait) == 0:
-        return np.nan
-        
-    # Find closest trait peak for each env peak
-    lags = []
-    for p_env in peaks_env:
-        # Find closest trait peak that is AFTER the env peak (causality)
-        # But lag could be small negative due to noise? No, should be positive.
-        
-        # Look for trait peak in [p_env, p_env + 180] (within half a year)
-        candidates = peaks_trait[(peaks_trait >= p_env) & (peaks_trait < p_env + 180)]
-        if len(candidates) > 0:
-            lags.append(candidates[0] - p_env)
-            
-    if len(lags) > 0:
-        avg_lag_days = np.mean(lags) * (OUTPUT_DT / 86400.0)
-        return avg_lag_days
-    else:
-        return np.nan
+    return seasonal_lag(env_segment, trait_segment, step_days=OUTPUT_DT / 86400.0)
 
 def analyze_lag(data_dir, label):
     print(f"Analyzing {label} in {data_dir}...")
@@ -113,22 +41,21 @@ def analyze_lag(data_dir, label):
 
     n_steps = data12.shape[0]
     time = np.arange(n_steps) * (OUTPUT_DT / 86400.0) / 360.0 # Years
-    y_bins = np.linspace(5.0, 25.0, 201)
+    y_bins = trait_axis(data12.shape[1])
     
     # Calculate Mean T_opt
-    mean_topt = np.zeros(n_steps)
-    for i in range(n_steps):
-        count = np.sum(data12[i, :])
-        if count > 0:
-            mean_topt[i] = np.sum(data12[i, :] * y_bins) / count
-        else:
-            mean_topt[i] = np.nan
+    mean_topt = trait_series(f"{data_dir}/fort.12", data12)['mean']
             
     env_temp = data10[:n_steps, 0]
     
     # Calculate Lag
-    lag_days = calculate_lag(time, env_temp, mean_topt)
-    print(f"Evolutionary Lag for {label}: {lag_days:.2f} days")
+    lag = calculate_lag(time, env_temp, mean_topt)
+    lag_days = lag['lag_days']
+    print(f"Evolutionary Lag for {label}: {lag_days:.2f} days "
+          f"(95% CI {lag['lag_ci'][0]:.2f} to {lag['lag_ci'][1]:.2f}, "
+          f"cross-correlation {lag['xcorr_lag_days']:.0f} days)")
+    print(f"Amplitude Ratio for {label}: {lag['amp_ratio']:.3f} "
+          f"(95% CI {lag['amp_ratio_ci'][0]:.3f} to {lag['amp_ratio_ci'][1]:.3f})")
     
     # Plot
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -1,6 +1,9 @@
 import numpy as np
-import struct
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common'))
+from fortio import RecordFile
 
 def analyze_medwed():
     filename = "output/fort.12"
@@ -13,48 +16,20 @@ def analyze_medwed():
     bin_width = 0.1
     start_temp = 5.0
     
-    # Data structure: 
-    # nbr_cls (201 integers) + growthmean0 (double) + growthmean (double)
-    # Integer size = 4 bytes, Double size = 8 bytes
-    # Total data size = 201*4 + 8 + 8 = 820 bytes
-    # Fortran record markers = 4 bytes before and after
-    record_size = 4 + 820 + 4
-    
-    last_record = None
-    count = 0
-    
-    with open(filename, "rb") as f:
-        while True:
-            chunk = f.read(record_size)
-            if not chunk:
-                break
-            if len(chunk) == record_size:
-                last_record = chunk
-                count += 1
-    
-    if last_record is None:
-        print("No data found.")
-        return
+    # fort.12 records are fixed-size (marker + 201 int32 + 2 float64 + marker),
+    # so the final record is read with a single seek instead of a full scan.
+    with RecordFile(filename, 12) as fort12:
+        count = len(fort12)
+        if count == 0:
+            print("No data found.")
+            return
+        last_record = fort12.last()
 
     print(f"Read {count} records. Analyzing the final record (Year 33)...")
-    
-    # Unpack
-    # Skip first 4 bytes (marker)
-    # Read 201 integers
-    # Read 2 doubles
-    # Skip last 4 bytes (marker)
-    
-    data_chunk = last_record[4:-4]
-    
-    # Format: 201i (integers), 2d (doubles)
-    # Use '=' to avoid alignment padding
-    fmt = f"={Ms+1}i2d"
-    unpacked = struct.unpack(fmt, data_chunk)
 
-    
-    nbr_cls = np.array(unpacked[:Ms+1])
-    growthmean0 = unpacked[-2]
-    growthmean = unpacked[-1]
+    nbr_cls = last_record['nbr_cls']
+    growthmean0 = last_record['growthmean0']
+    growthmean = last_record['growthmean']
     
     # Calculate Mean Topt
     total_agents = np.sum(nbr_cls)
@@ -62,10 +37,8 @@ def analyze_medwed():
         print("No agents found in final step.")
         return
         
-    weighted_sum = 0.0
-    for j in range(Ms+1):
-        temp_center = start_temp + j * bin_width + (bin_width / 2.0)
-        weighted_sum += nbr_cls[j] * temp_center
+    temp_center = start_temp + np.arange(Ms+1) * bin_width + (bin_width / 2.0)
+    weighted_sum = np.sum(nbr_cls * temp_center)
         
     mean_topt = weighted_sum / total_agents
     
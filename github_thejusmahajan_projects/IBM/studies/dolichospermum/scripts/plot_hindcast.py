@@ -1,9 +1,13 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.io import FortranFile
 import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common'))
+from fortio import read_fort10, read_fort11, read_fort12
+from derived import trait_series
+from lag import rolling_seasonal_lag, save_lag_table
+
 # Configuration
 PLOT_DIR = "plots"
 os.makedirs(PLOT_DIR, exist_ok=True)
@@ -17,23 +21,6 @@ OUTPUT_DT = 86400.0 * 10.0 # Output every 10 days (based on wcm.F90 modification
 
 OUTPUT_DT = 86400.0 # Daily output
 
-def read_fort11(filename):
-    data = []
-    try:
-        f = FortranFile(filename, 'r')
-        while True:
-            try:
-                # WRITE(11) aorg(lnew),detr(lnew),phyt(lnew)
-                record = f.read_record(dtype=np.float64)
-                data.append(record)
-            except Exception:
-                break
-        f.close()
-    except FileNotFoundError:
-        print(f"File {filename} not found.")
-        return None
-    return np.array(data)
-
 def plot_hindcast(evolving_file, static_file):
     print("Reading Evolving Scenario...")
     data_evol = read_fort11(evolving_file)
@@ -145,5 +132,62 @@ def plot_hindcast(evolving_file, static_file):
     print(f"Late (95-100y) Static:   Mean={mean_stat_late:.3f}, Peak={max_stat_late:.3f}")
     print("--------------------------\n")
 
+def plot_lag_drift(data_dir, scenarios=("evolving", "static"), window_years=1):
+    """
+    Year-by-year evolutionary lag and amplitude ratio of each scenario, from
+    fort.10.<scenario> and fort.12.<scenario>. Writes one CSV table per
+    scenario and a drift plot.
+    """
+    tables = {}
+    for scenario in scenarios:
+        file10 = f"{data_dir}/fort.10.{scenario}"
+        file12 = f"{data_dir}/fort.12.{scenario}"
+        if not (os.path.exists(file10) and os.path.exists(file12)):
+            print(f"Skipping lag drift for {scenario}: needs {file10} and {file12}")
+            continue
+        data10 = read_fort10(file10)
+        data12 = read_fort12(file12)
+        mean_topt = trait_series(file12, data12)['mean']
+
+        table = rolling_seasonal_lag(data10[:, 0], mean_topt, step_days=OUTPUT_DT / 86400.0,
+                                     window_years=window_years)
+        tables[scenario] = table
+        save_lag_table(table, f"{PLOT_DIR}/hindcast_lag_{scenario}.csv")
+        print(f"Generated hindcast_lag_{scenario}.csv")
+
+        n = min(5, len(table['lag_days']))
+        print(f"{scenario.capitalize()}: Lag {np.nanmean(table['lag_days'][:n]):.1f} -> "
+              f"{np.nanmean(table['lag_days'][-n:]):.1f} days, Amplitude Ratio "
+              f"{np.nanmean(table['amp_ratio'][:n]):.3f} -> {np.nanmean(table['amp_ratio'][-n:]):.3f} "
+              f"(first vs last {n} windows)")
+
+    if not tables:
+        return
+
+    colors = {'evolving': 'r', 'static': 'b'}
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
+    for scenario, table in tables.items():
+        color = colors.get(scenario, 'k')
+        year = 0.5 * (table['year_start'] + table['year_end'])
+        ax1.plot(year, table['lag_days'], color=color, linewidth=1.5, label=f'{scenario.capitalize()}')
+        ax1.fill_between(year, table['lag_ci'][:, 0], table['lag_ci'][:, 1], color=color, alpha=0.2)
+        ax2.plot(year, table['amp_ratio'], color=color, linewidth=1.5, label=f'{scenario.capitalize()}')
+        ax2.fill_between(year, table['amp_ratio_ci'][:, 0], table['amp_ratio_ci'][:, 1], color=color, alpha=0.2)
+
+    ax1.set_ylabel('Evolutionary Lag [days]')
+    ax1.set_title('Climate Change Hindcast: Drift of Lag and Amplitude Ratio')
+    ax1.legend()
+    ax1.grid(True, alpha=0.3)
+    ax2.set_ylabel('Amplitude Ratio (Mean $T_{opt}$ / Env)')
+    ax2.set_xlabel('Time [Years]')
+    ax2.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(f"{PLOT_DIR}/hindcast_lag_drift.png", dpi=300)
+    plt.close()
+    print("Generated hindcast_lag_drift.png")
+    return tables
+
 if __name__ == "__main__":
     plot_hindcast("output/fort.11.evolving", "output/fort.11.static")
+    plot_lag_drift("output")
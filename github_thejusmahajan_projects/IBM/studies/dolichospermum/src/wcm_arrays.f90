@@ -3,7 +3,7 @@ MODULE wcm_arrays
 
 IMPLICIT NONE
 
-INTEGER :: nyears
+INTEGER :: nyears, seed
 
 ! Namelist variables
 REAL*8 :: aorg_init, phyt_init, mu_max_day, kn, mutation_width
@@ -121,3 +121,138 @@ INTEGER, DIMENSION(0:Ms)   :: nbr_cls
 REAL*8, DIMENSION(0:Ms,2)  :: strain
 REAL*8, DIMENSION(0:Ms)    :: strainpos,sloss,suptake
 END MODULE wcm_arrays
+
+!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+! wcm_random                                                           !
+!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+! Reproducible random numbers with one xoshiro256** stream per OpenMP
+! thread. rng_seed derives stream 0 from the seed of the namelist
+! (splitmix64) and starts thread k on stream 0 jumped ahead k*2**128
+! draws, so the streams of the threads never overlap; serial code draws
+! from stream 0. A negative seed takes one from the system, as the former
+! CALL RANDOM_SEED() did. The 64-bit arithmetic is done on 32/16-bit
+! pieces so that it never overflows a signed integer.
+MODULE wcm_random
+
+!$ USE omp_lib
+
+IMPLICIT NONE
+
+PRIVATE
+PUBLIC :: rng_seed, rng_uniform
+
+INTEGER*8, PARAMETER :: mask16 = 65535_8, mask32 = 4294967295_8
+
+! state of thread k in rng_state(1:4,k), padded to 64 bytes per thread
+INTEGER*8, ALLOCATABLE, DIMENSION(:,:) :: rng_state
+INTEGER :: rng_nthreads = 1
+
+CONTAINS
+
+PURE FUNCTION add64(a, b) RESULT(c)
+! a+b modulo 2**64
+INTEGER*8, INTENT(IN) :: a, b
+INTEGER*8 :: c, lo, hi
+lo = IAND(a, mask32) + IAND(b, mask32)
+hi = ISHFT(a, -32) + ISHFT(b, -32) + ISHFT(lo, -32)
+c = IOR(ISHFT(IAND(hi, mask32), 32), IAND(lo, mask32))
+END FUNCTION add64
+
+PURE FUNCTION mul64(a, b) RESULT(c)
+! a*b modulo 2**64, from 16-bit limbs
+INTEGER*8, INTENT(IN) :: a, b
+INTEGER*8 :: c, t, carry, x(0:3), y(0:3)
+INTEGER :: i, k
+DO i=0,3
+  x(i) = IAND(ISHFT(a, -16*i), mask16)
+  y(i) = IAND(ISHFT(b, -16*i), mask16)
+ENDDO
+c = 0
+carry = 0
+DO k=0,3
+  t = carry
+  DO i=0,k
+    t = t + x(i)*y(k-i)
+  ENDDO
+  c = IOR(c, ISHFT(IAND(t, mask16), 16*k))
+  carry = ISHFT(t, -16)
+ENDDO
+END FUNCTION mul64
+
+SUBROUTINE splitmix64(x, z)
+INTEGER*8, INTENT(INOUT) :: x
+INTEGER*8, INTENT(OUT) :: z
+x = add64(x, INT(Z'9E3779B97F4A7C15', 8))
+z = mul64(IEOR(x, ISHFT(x, -30)), INT(Z'BF58476D1CE4E5B9', 8))
+z = mul64(IEOR(z, ISHFT(z, -27)), INT(Z'94D049BB133111EB', 8))
+z = IEOR(z, ISHFT(z, -31))
+END SUBROUTINE splitmix64
+
+FUNCTION next(s) RESULT(r)
+! xoshiro256**: next 64 random bits of state s
+INTEGER*8, INTENT(INOUT) :: s(4)
+INTEGER*8 :: r, x, t
+x = ISHFTC(add64(s(2), ISHFT(s(2), 2)), 7) ! rotl(s1*5, 7)
+r = add64(x, ISHFT(x, 3))                  ! *9
+t = ISHFT(s(2), 17)
+s(3) = IEOR(s(3), s(1))
+s(4) = IEOR(s(4), s(2))
+s(2) = IEOR(s(2), s(3))
+s(1) = IEOR(s(1), s(4))
+s(3) = IEOR(s(3), t)
+s(4) = ISHFTC(s(4), 45)
+END FUNCTION next
+
+SUBROUTINE jump(s)
+! advance s by 2**128 draws
+INTEGER*8, INTENT(INOUT) :: s(4)
+INTEGER*8, PARAMETER :: jumps(4) = (/ INT(Z'180EC6D33CFD0ABA', 8), INT(Z'D5A61266F0C9392C', 8), &
+                                      INT(Z'A9582618E03FC9AA', 8), INT(Z'39ABDC4529B1661C', 8) /)
+INTEGER*8 :: t(4), r
+INTEGER :: i, b
+t = 0
+DO i=1,4
+  DO b=0,63
+    IF(BTEST(jumps(i), b)) t = IEOR(t, s)
+    r = next(s)
+  ENDDO
+ENDDO
+s = t
+END SUBROUTINE jump
+
+SUBROUTINE rng_seed(seed)
+INTEGER, INTENT(IN) :: seed
+INTEGER*8 :: x, s(4)
+INTEGER :: k
+REAL*8 :: u
+x = INT(seed, 8)
+IF(seed.lt.0) THEN
+  CALL RANDOM_SEED()
+  CALL RANDOM_NUMBER(u)
+  x = INT(u*2147483647.d0, 8)
+  WRITE(6,*) 'seed drawn from the system:', x
+ENDIF
+DO k=1,4
+  CALL splitmix64(x, s(k))
+ENDDO
+rng_nthreads = 1
+!$ rng_nthreads = omp_get_max_threads()
+IF(ALLOCATED(rng_state)) DEALLOCATE(rng_state)
+ALLOCATE(rng_state(8, 0:rng_nthreads-1))
+rng_state = 0
+DO k=0,rng_nthreads-1
+  rng_state(1:4,k) = s
+  CALL jump(s)
+ENDDO
+END SUBROUTINE rng_seed
+
+SUBROUTINE rng_uniform(u)
+! uniform in (0,1) from the stream of the calling thread
+REAL*8, INTENT(OUT) :: u
+INTEGER :: k
+k = 0
+!$ k = MOD(omp_get_thread_num(), rng_nthreads)
+u = (REAL(ISHFT(next(rng_state(1:4,k)), -11), 8) + 0.5d0) * 2.d0**(-53)
+END SUBROUTINE rng_uniform
+
+END MODULE wcm_random
@@ -29,7 +29,7 @@ cpp -P "$SRC_DIR/phyt_ibm.F90" > phyt_ibm.f90
 # -w: Suppress warnings
 # -O3: High optimization
 echo "Compiling..."
-gfortran -c "$SRC_DIR/wcm_arrays.f90"
+gfortran -fopenmp -c "$SRC_DIR/wcm_arrays.f90"
 gfortran -fmax-stack-var-size=32768 -w -O3 -fopenmp -o wcm.x wcm.f90 phyt_ibm.f90 wcm_arrays.o
 
 # Run
@@ -0,0 +1,132 @@
+"""
+Round trip of the streaming GIF writer of common/animation.py through
+Pillow's decoder: frame count, frame durations and pixels.
+
+Usage:
+    python3 -m pytest tests
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from animation import GifWriter, concat_segments, render_segment
+
+Image = pytest.importorskip('PIL.Image')
+
+SIZE = (40, 30)
+COLORS = np.array([[255, 255, 255], [200, 30, 30], [30, 30, 200], [0, 0, 0]], dtype=np.uint8)
+
+
+def _frames():
+    """RGB frames drawing only COLORS, all of which are in the first frame."""
+    width, height = SIZE
+    first = np.zeros((height, width, 3), dtype=np.uint8)
+    for k, color in enumerate(COLORS):
+        first[:, k * width // len(COLORS):(k + 1) * width // len(COLORS)] = color
+    frames = [first]
+    for k in range(1, 6):
+        frame = frames[-1].copy()
+        frame[5 + k:12 + k, 3 * k:3 * k + 4] = COLORS[k % len(COLORS)]
+        frames.append(frame)
+    frames.append(frames[-1].copy()) # unchanged frame
+    return frames
+
+
+def _decode(filename):
+    with Image.open(filename) as image:
+        frames, durations = [], []
+        for k in range(image.n_frames):
+            image.seek(k)
+            durations.append(image.info['duration'])
+            frames.append(np.asarray(image.convert('RGB')))
+    return frames, durations
+
+
+def _write(filename, frames, fps=20):
+    writer = GifWriter(filename, fps=fps, size=(frames[0].shape[1], frames[0].shape[0]))
+    for frame in frames:
+        rgba = np.concatenate([frame, np.full(frame.shape[:2] + (1,), 255, dtype=np.uint8)], axis=2)
+        writer.write(rgba.tobytes())
+    writer.close()
+    return writer.n_frames
+
+
+def _palette_frames(n_colors, n_frames=5, seed=0):
+    """Frames of n_colors random colours, all in the first frame; later frames repaint blocks of a few of them."""
+    rng = np.random.default_rng(seed)
+    colors = rng.choice(1 << 24, n_colors, replace=False)
+    colors = np.stack([colors & 0xFF, (colors >> 8) & 0xFF, colors >> 16], axis=1).astype(np.uint8)
+    width, height = 32, 16
+    first = colors[np.arange(width * height) % n_colors].reshape(height, width, 3)
+    frames = [first]
+    for k in range(1, n_frames):
+        frame = frames[-1].copy()
+        frame[k:k + 4, 2 * k:2 * k + 6] = colors[rng.integers(0, n_colors)]
+        frames.append(frame)
+    return frames
+
+
+def test_gif_round_trip(tmp_path):
+    filename = str(tmp_path / 'frames.gif')
+    frames = _frames()
+    n_frames = _write(filename, frames)
+
+    decoded, durations = _decode(filename)
+    assert len(decoded) == len(frames) == n_frames
+    assert durations == [50] * len(frames)
+    for expected, actual in zip(frames, decoded):
+        np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize('n_colors', [1, 2, 3, 17, 256])
+def test_gif_palette_layouts(tmp_path, n_colors):
+    # Colour tables of every size from 2 to 256 entries; the repainted rectangles get smaller local tables
+    filename = str(tmp_path / 'palette.gif')
+    frames = _palette_frames(n_colors)
+    _write(filename, frames)
+
+    decoded, _ = _decode(filename)
+    assert len(decoded) == len(frames)
+    for expected, actual in zip(frames, decoded):
+        np.testing.assert_array_equal(actual, expected)
+    with Image.open(filename) as image:
+        assert 'transparency' not in image.info
+        for k in range(image.n_frames):
+            image.seek(k)
+            assert image.disposal_method == 1
+
+
+def test_gif_segments_with_different_palettes(tmp_path):
+    segments = [str(tmp_path / f'segment_{k}.gif') for k in range(3)]
+    expected = []
+    for k, (segment, n_colors) in enumerate(zip(segments, (3, 40, 256))):
+        frames = _palette_frames(n_colors, n_frames=3, seed=k)
+        _write(segment, frames, fps=10)
+        expected += frames
+    joined = str(tmp_path / 'joined.gif')
+    concat_segments(segments, joined)
+
+    decoded, durations = _decode(joined)
+    assert len(decoded) == len(expected) and durations == [100] * len(expected)
+    for a, b in zip(expected, decoded):
+        np.testing.assert_array_equal(b, a)
+
+
+def test_gif_segments_join(tmp_path):
+    rng = np.random.default_rng(1)
+    dist = rng.integers(0, 50, size=(12, 201))
+    labels = [str(k) for k in range(dist.shape[0])]
+    segments = [str(tmp_path / f'segment_{k}.gif') for k in range(3)]
+    for k, segment in enumerate(segments):
+        render_segment(dist[4 * k:4 * k + 4], labels[4 * k:4 * k + 4], segment, fps=10, figsize=(3, 2), dpi=50,
+                       ymax=60)
+    joined = str(tmp_path / 'joined.gif')
+    concat_segments(segments, joined)
+
+    frames, durations = _decode(joined)
+    assert len(frames) == dist.shape[0] and durations == [100] * dist.shape[0]
+    expected = [frame for segment in segments for frame in _decode(segment)[0]]
+    for a, b in zip(expected, frames):
+        np.testing.assert_array_equal(b, a)
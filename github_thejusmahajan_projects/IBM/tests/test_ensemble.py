@@ -0,0 +1,49 @@
+"""
+Rerun of an ensemble run directory whose output has already been read
+through the run cache and the derived cache.
+
+Usage:
+    python3 -m pytest tests
+"""
+import os
+import stat
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from derived import trait_series
+from ensemble import make_job, run_job
+from fortio import read_fort12
+from synthetic import generate
+
+NAMELIST = "&model_params\n  nyears = 1\n  seed = 1\n/\n"
+
+
+def _fake_model(tmp_path):
+    """A 'wcm.x' that copies a synthetic run into its working directory."""
+    source = generate(str(tmp_path / 'source'), 1)
+    binary = tmp_path / 'wcm.x'
+    binary.write_text(f"#!/bin/sh\ncp {source}/fort.* .\n")
+    binary.chmod(binary.stat().st_mode | stat.S_IXUSR)
+    return str(binary), source
+
+
+def test_rerun_after_cached_read(tmp_path):
+    binary, source = _fake_model(tmp_path)
+    run_dir = str(tmp_path / 'runs' / 'key')
+    job = make_job(NAMELIST)
+    assert run_job(binary, run_dir, job, threads=1)['status'] == 'done'
+
+    # Analysing the run leaves fort_cache/ and derived/ in its directory
+    read_fort12(os.path.join(run_dir, 'fort.12'))
+    trait_series(os.path.join(run_dir, 'fort.12'))
+    os.makedirs(os.path.join(run_dir, 'fort_cache.tmp123'))
+    assert {'fort_cache', 'derived'} <= set(os.listdir(run_dir))
+
+    manifest = run_job(binary, run_dir, job, threads=1)
+    assert manifest['status'] == 'done'
+    left = set(os.listdir(run_dir))
+    assert not {'fort_cache', 'fort_cache.tmp123', 'derived'} & left
+    np.testing.assert_array_equal(read_fort12(os.path.join(run_dir, 'fort.12')),
+                                  read_fort12(os.path.join(source, 'fort.12')))
@@ -0,0 +1,26 @@
+"""
+Contour levels of common/hovmoller.py's plot_hovmoller.
+
+Usage:
+    python3 -m pytest tests
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from hovmoller import plot_hovmoller
+
+matplotlib = pytest.importorskip('matplotlib')
+matplotlib.use('Agg')
+
+
+@pytest.mark.parametrize('levels, n_contours', [(None, 0), ([], 0), ([0.3, 0.6], 1), (np.array([0.3, 0.6]), 1),
+                                                (0, 1), (3, 1)])
+def test_levels(levels, n_contours):
+    from matplotlib.figure import Figure
+    matrix = np.random.default_rng(0).random((20, 500))
+    ax = Figure(figsize=(4, 3)).add_subplot()
+    plot_hovmoller(ax, matrix, np.arange(500.0), np.arange(20.0), dpi=50, levels=levels)
+    assert len(ax.collections) == n_contours